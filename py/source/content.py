@@ -0,0 +1,128 @@
+import mmap
+import os
+import threading
+
+import logging
+
+log = logging.getLogger('paste')
+
+from ..util import OrderedDict
+
+from .runtime import env
+
+
+class PrimedContentCache(object):
+    # size aware LRU of small primed files. keys include size and mtime so a rebuilt file is never served stale
+    def __init__(self, max_bytes, max_entry_bytes):
+        super(PrimedContentCache, self).__init__()
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self._entries = OrderedDict()
+        self._byte_size = 0
+        self._lock = threading.Lock()
+
+    @property
+    def byte_size(self):
+        return self._byte_size
+
+    def cacheable(self, byte_size):
+        return byte_size <= self.max_entry_bytes and byte_size <= self.max_bytes
+
+    def get(self, key):
+        with self._lock:
+            contents = self._entries.pop(key, None)
+            if contents is not None:
+                self._entries[key] = contents
+            return contents
+
+    def put(self, key, contents):
+        if not self.cacheable(len(contents)):
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._byte_size -= len(previous)
+
+            self._entries[key] = contents
+            self._byte_size += len(contents)
+
+            while self._byte_size > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._byte_size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._byte_size = 0
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = PrimedContentCache(env.content_cache_size, env.content_cache_entry_size)
+    return _cache
+
+
+def _cache_key(abs_path, stat_result):
+    return abs_path, stat_result.st_size, stat_result.st_mtime
+
+
+def _read(abs_path):
+    opened_file = open(abs_path, 'rb')
+    try:
+        return opened_file.read()
+    finally:
+        opened_file.close()
+
+
+def open_primed(abs_path):
+    # suitable for wsgi.file_wrapper / sendfile, nothing is read into the heap
+    return open(abs_path, 'rb')
+
+
+def map_primed(abs_path):
+    opened_file = open(abs_path, 'rb')
+    try:
+        if not os.fstat(opened_file.fileno()).st_size:
+            return buffer('')
+        # the mapping stays valid after the descriptor is closed
+        return buffer(mmap.mmap(opened_file.fileno(), 0, access=mmap.ACCESS_READ))
+    finally:
+        opened_file.close()
+
+
+def _read_cached(abs_path, stat_result):
+    cache = get_cache()
+    key = _cache_key(abs_path, stat_result)
+    contents = cache.get(key)
+    if contents is None:
+        contents = _read(abs_path)
+        cache.put(key, contents)
+    return contents
+
+
+def view_primed(abs_path):
+    # read only, zero copy view. small files come from the shared cache, larger ones are memory mapped
+    # so they live in the page cache rather than in each worker's heap
+    stat_result = os.stat(abs_path)
+    if not get_cache().cacheable(stat_result.st_size):
+        return map_primed(abs_path)
+    return buffer(_read_cached(abs_path, stat_result))
+
+
+def read_primed(abs_path):
+    if not os.path.exists(abs_path):
+        log.warning('Error reading file %s' % abs_path)
+        return ''
+
+    stat_result = os.stat(abs_path)
+    if not get_cache().cacheable(stat_result.st_size):
+        return _read(abs_path)
+    return _read_cached(abs_path, stat_result)
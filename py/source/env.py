@@ -51,6 +51,53 @@ class BaseEnv(object):
     def network_request_threshold(self):
         raise NotImplementedError('')
 
+    # optional settings below; subclasses may override the defaults
+
+    @property
+    def version_retention_count(self):
+        # number of previous primed versions to keep per module, None keeps all
+        return None
+
+    @property
+    def version_retention_age(self):
+        # seconds a previous primed version is kept for, None keeps all
+        return None
+
+    @property
+    def content_cache_size(self):
+        # total bytes of small primed files held in memory per process
+        return 8 * 1024 * 1024
+
+    @property
+    def content_cache_entry_size(self):
+        # primed files larger than this are memory mapped rather than cached
+        return 64 * 1024
+
+    @property
+    def artifact_store(self):
+        # a paste.source.store.ArtifactStore shared between build and web nodes, None to only use local files
+        return None
+
+    @property
+    def batch_compilation(self):
+        # compile changed javascript modules together, one closure invocation per compilation level
+        return False
+
+    @property
+    def source_maps(self):
+        # write a source map next to every primed file
+        return False
+
+    @property
+    def size_budgets(self):
+        # module name pattern -> limits, see paste.source.report.BuildReport.check_budgets
+        return {}
+
+    @property
+    def reproducible_builds(self):
+        # save manifests in a canonical form without build timestamps, see paste.source.reproducible
+        return False
+
 
 class DefaultEnv(BaseEnv):
     @property
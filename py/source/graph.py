@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+import cPickle
+import collections
+import os
+import sys
+
+
+class DependencyIndex(object):
+    # forward (module -> what it requires) and reverse (module -> what requires it) adjacency of direct edges
+
+    def __init__(self, forward=None, reverse=None):
+        super(DependencyIndex, self).__init__()
+        self.forward = dict((name, set(deps)) for name, deps in (forward or {}).iteritems())
+        if reverse is None:
+            reverse = {}
+            for name, deps in self.forward.iteritems():
+                for dep in deps:
+                    reverse.setdefault(dep, set()).add(name)
+        self.reverse = dict((name, set(dependents)) for name, dependents in reverse.iteritems())
+
+    @classmethod
+    def _walk(cls, adjacency, names):
+        seen = set()
+        queue = collections.deque(names)
+        while queue:
+            for neighbour in adjacency.get(queue.popleft(), ()):
+                if neighbour not in seen:
+                    seen.add(neighbour)
+                    queue.append(neighbour)
+        return seen
+
+    def dependencies(self, name, transitive=False):
+        if transitive:
+            return sorted(self._walk(self.forward, [name]) - {name})
+        return sorted(self.forward.get(name, ()))
+
+    def dependents(self, name, transitive=False):
+        if transitive:
+            return sorted(self._walk(self.reverse, [name]) - {name})
+        return sorted(self.reverse.get(name, ()))
+
+    def affected(self, names):
+        # the modules to rebuild when names change: the names themselves and everything depending on them
+        return sorted(set(names) | self._walk(self.reverse, names))
+
+    def path(self, source, target):
+        # shortest chain of requires from source to target, None when target isn't reachable
+        parents = {source: None}
+        queue = collections.deque([source])
+        while queue:
+            name = queue.popleft()
+            if name == target:
+                chain = []
+                while name is not None:
+                    chain.append(name)
+                    name = parents[name]
+                return chain[::-1]
+            for dep in sorted(self.forward.get(name, ())):
+                if dep not in parents:
+                    parents[dep] = name
+                    queue.append(dep)
+        return None
+
+    def orphans(self):
+        # modules nothing requires and that require nothing
+        return sorted(name for name, deps in self.forward.iteritems() if not deps and not self.reverse.get(name))
+
+    def missing(self):
+        # required names no module declares
+        return sorted(dep for dep in self.reverse if dep not in self.forward)
+
+    def serialize(self):
+        return {
+            'forward': dict((name, sorted(deps)) for name, deps in self.forward.iteritems()),
+            'reverse': dict((name, sorted(dependents)) for name, dependents in self.reverse.iteritems())
+        }
+
+    @classmethod
+    def deserialize(cls, obj):
+        return cls(forward=obj.get('forward'), reverse=obj.get('reverse'))
+
+
+def index_path(manifest_path):
+    # the index is also saved on its own next to the manifest, so a query doesn't unpickle every module
+    return os.path.splitext(manifest_path)[0] + '.graph.pkl'
+
+
+def load_graph(manifest_path):
+    # content type -> serialized index. manifests saved before the separate index existed are read whole
+    separate = os.path.exists(index_path(manifest_path))
+    graph_file = open(index_path(manifest_path) if separate else manifest_path, 'rb')
+    try:
+        graph = cPickle.load(graph_file)
+    finally:
+        graph_file.close()
+    return (graph if separate else graph.get('graph')) or {}
+
+
+def main(argv=None):
+    # only the command line needs argparse, keep it out of the manifest's imports
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Query the dependency index of a built paste manifest.')
+    parser.add_argument('manifest', help='path to the built manifest, e.g. _build.pkl')
+    parser.add_argument('content_type', help='content type key, e.g. js')
+    parser.add_argument('query', choices=('dependencies', 'dependents', 'affected', 'path', 'orphans', 'missing'))
+    parser.add_argument('names', nargs='*')
+    parser.add_argument('-t', '--transitive', action='store_true', help='follow edges transitively')
+    args = parser.parse_args(argv)
+
+    graph = load_graph(args.manifest).get(args.content_type)
+    if graph is None:
+        parser.error('no dependency index for content type %s' % args.content_type)
+    index = DependencyIndex.deserialize(graph)
+
+    if args.query in ('dependencies', 'dependents'):
+        if len(args.names) != 1:
+            parser.error('%s takes one module name' % args.query)
+        results = getattr(index, args.query)(args.names[0], transitive=args.transitive)
+    elif args.query == 'affected':
+        results = index.affected(args.names)
+    elif args.query == 'path':
+        if len(args.names) != 2:
+            parser.error('path takes a source and a target module name')
+        results = index.path(*args.names) or []
+    else:
+        results = getattr(index, args.query)()
+
+    for name in results:
+        sys.stdout.write(name + '\n')
+    return 0 if results or args.query in ('orphans', 'missing') else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,30 +2,90 @@
 
 import cPickle
 import functools
+import hashlib
 import operator
 import traceback
 import os
+import threading
+import time
 
 import logging
 
 log = logging.getLogger('paste')
 
-from ..util import OrderedDict, OrderedSet, content_type_helper
+from ..util import OrderedSet, content_type_helper
 
-from .runtime import Runtime
-env = Runtime.get().env
+from .runtime import env
 
-from . import module as paste_module, primer as paste_primer
+from . import graph as paste_graph, module as paste_module, primer as paste_primer, report as paste_report, \
+    reproducible as paste_reproducible, sourcemap as paste_sourcemap, store as paste_store
 
 
 class ContentTypeManifest(object):
-    def __init__(self, content_type, manifest, sorted_deps):
+    INLINE = 'inline'
+    URL = 'url'
+    BUNDLE_PREFIX = '_bundle'
+
+    def __init__(self, content_type, manifest, sorted_deps, fingerprint=None, manifest_fingerprint=None):
         super(ContentTypeManifest, self).__init__()
         self.content_type = content_type
         self.manifest = manifest
         self.sorted_deps = sorted_deps
+        self.fingerprint = fingerprint
+        self.manifest_fingerprint = manifest_fingerprint
         self._primer = None
 
+    @property
+    def etag(self):
+        return '"%s"' % self.fingerprint if self.fingerprint else None
+
+    def bundle_etag(self, module_names):
+        # modules are content addressed, so the checksums of a bundle's members identify the bundle
+        checksums = [self.manifest[module_name].checksum or ''
+                     for module_name in module_names if module_name in self.manifest]
+        return '"%s"' % hashlib.md5('|'.join(checksums)).hexdigest()
+
+    def url(self, module_name):
+        module = self.manifest.get(module_name)
+        return module.url if module is not None else None
+
+    def bundle_members(self, module_name):
+        # the module's dependencies in sorted order followed by the module itself
+        module = self.manifest.get(module_name)
+        if module is None:
+            return []
+        return [dep_name for (dep_name, _, _) in self.sorted_deps
+                if dep_name in module.dependencies and dep_name in self.manifest] + [module_name]
+
+    def bundle_url(self, module_name):
+        # the bundle checksum is part of the url, so a bundle url never changes meaning and can be cached forever
+        if module_name not in self.manifest:
+            return None
+        return '%s/%s/%s/%s%s' % (
+            env.root_uri.rstrip('/'), self.BUNDLE_PREFIX, self.bundle_etag(self.bundle_members(module_name)).strip('"'),
+            module_name, self.content_type.file_extension
+        )
+
+    def resolve_assets(self, module_names):
+        # (module_name, INLINE, payload) for modules small enough to embed, (module_name, URL, url) for the rest
+        assets = []
+        for module_name in module_names:
+            module = self.manifest.get(module_name)
+            if module is None:
+                continue
+            if module.inline_contents is not None:
+                assets.append((module_name, self.INLINE, module.inline_contents))
+            else:
+                assets.append((module_name, self.URL, self.url(module_name)))
+        return assets
+
+    def bundle_source_map(self, module_names, file_name=None, separator='\n'):
+        # index map for the given modules concatenated in order with separator
+        modules = [self.manifest[module_name] for module_name in module_names if module_name in self.manifest]
+        return paste_sourcemap.compose_index_map(file_name, [
+            (module.contents, paste_sourcemap.read_map(module.abs_source_map_path)) for module in modules
+        ], separator=separator)
+
     @property
     def primer(self):
         if self._primer is None:
@@ -33,8 +93,33 @@ class ContentTypeManifest(object):
         return self._primer
 
 
+class CollectionReport(object):
+    def __init__(self, dry_run=False):
+        super(CollectionReport, self).__init__()
+        self.dry_run = dry_run
+        self.removed_paths = []
+        self.trimmed_versions = 0
+        self.reclaimed_bytes = 0
+
+    def add(self, abs_path, byte_size):
+        self.removed_paths.append(abs_path)
+        self.reclaimed_bytes += byte_size
+
+    def __str__(self):
+        return '%s%d files, %d versions, %d bytes reclaimed' % (
+            '[dry run] ' if self.dry_run else '',
+            len(self.removed_paths),
+            self.trimmed_versions,
+            self.reclaimed_bytes
+        )
+
+
 class Manifest(object):
     _instance = None
+    # guards _instance and every build, load and snapshot. reads of a published snapshot take no lock
+    _lock = threading.RLock()
+    # seconds before artifacts that failed to fetch are tried again
+    FETCH_RETRY_INTERVAL = 60
 
     class ParseException(Exception):
         pass
@@ -42,60 +127,140 @@ class Manifest(object):
     class OpenException(Exception):
         pass
 
-    def __init__(self, manifest=None, sorted_deps=None):
+    def __init__(self, manifest=None, sorted_deps=None, gc_pending=None, fingerprints=None,
+                 serialized_manifest=None, built_content_types=None, report=None, graph=None):
         super(Manifest, self).__init__()
         self._manifest = manifest or dict((primer.content_type.type, {})
                                           for primer in paste_primer.PrimerHelper.primers)
+        # content type -> serialized modules, deserialized on first use of that content type
+        self._serialized_manifest = serialized_manifest or {}
+        self._built_content_types = set(built_content_types or [])
+        self._fetched_content_types = set()
+        # content type -> time a failed artifact fetch is retried at
+        self._fetch_retry_at = {}
+        self._report = paste_report.BuildReport.deserialize(report) if report else paste_report.BuildReport()
+        # growth budgets compare against the report of the saved manifest, however many builds run after loading
+        self._previous_report = self._report if report else None
+        # content type -> ContentTypeManifest, replaced rather than mutated so readers never need the lock
+        self._snapshots = {}
+        # content type -> DependencyIndex of the direct @requires edges
+        self._graph = dict((content_type_key, paste_graph.DependencyIndex.deserialize(serialized_index))
+                           for content_type_key, serialized_index in (graph or {}).iteritems())
+        # content type -> module name -> direct dependencies, collected while priming, before sorting backfills them
+        self._direct_dependencies = {}
         self._sorted_deps = sorted_deps or dict((primer.content_type.type, None)
                                                 for primer in paste_primer.PrimerHelper.primers)
+        # (content_type, module_name) pairs holding previous versions not yet collected
+        self._gc_pending = set(tuple(key) for key in gc_pending) if gc_pending else set()
+        # content type -> fingerprint, plus the manifest wide fingerprint under None
+        self._fingerprints = fingerprints or {}
 
     def __hash__(self):
-        ordered_manifest = OrderedDict(sorted(self._manifest.iteritems(), key=lambda k: k[0]))
-        manifest_hash = hash(cPickle.dumps(sorted([
-            (content_type, sorted([(module_name, hash(module))
-                                   for (module_name, module) in content_type_manifest.iteritems()],
-                                  key=lambda tup: tup[0]))
-            for (content_type, content_type_manifest) in ordered_manifest.iteritems()
-        ]), protocol=cPickle.HIGHEST_PROTOCOL))
-
-        sorted_dep_hash = hash(cPickle.dumps(
-            sorted(self._sorted_deps.iteritems(), key=operator.itemgetter(1)),
-            protocol=cPickle.HIGHEST_PROTOCOL)
-        )
+        return hash(self.fingerprint)
+
+    def _content_type_fingerprint(self, content_type_key):
+        # only uses values stored at build time, nothing here touches the file system
+        content_type_hash = hashlib.md5()
+        for module_name, module in sorted(self._manifest.get(content_type_key, {}).iteritems(),
+                                          key=operator.itemgetter(0)):
+            content_type_hash.update('%s|%s|%s|%s|%s\n' % (
+                module_name, module.checksum, module.version, module.path or module.declared_path,
+                module.version_removed
+            ))
+        content_type_hash.update(cPickle.dumps(self._sorted_deps.get(content_type_key),
+                                              protocol=cPickle.HIGHEST_PROTOCOL))
+        return content_type_hash.hexdigest()
+
+    def _compute_fingerprints(self, content_type_keys=None):
+        fingerprints = dict(self._fingerprints)
+        fingerprints.pop(None, None)
+        all_keys = set(self._manifest) | set(self._serialized_manifest)
+        for content_type_key in (all_keys if content_type_keys is None else content_type_keys):
+            self._get_modules(content_type_key)
+            fingerprints[content_type_key] = self._content_type_fingerprint(content_type_key)
+        # the manifest wide fingerprint needs every content type, a single one is computed without it
+        if all_keys <= set(fingerprints):
+            fingerprints[None] = hashlib.md5('|'.join(
+                '%s:%s' % (content_type_key, fingerprint)
+                for content_type_key, fingerprint in sorted(fingerprints.iteritems())
+            )).hexdigest()
+        self._fingerprints = fingerprints
 
-        return hash(u'%s|%s' % (manifest_hash, sorted_dep_hash))
+    @property
+    def fingerprint(self):
+        if None not in self._fingerprints:
+            content_type_keys = set(self._manifest) | set(self._serialized_manifest)
+            self._compute_fingerprints(content_type_keys - set(self._fingerprints))
+        return self._fingerprints[None]
+
+    def get_fingerprint(self, content_type):
+        if content_type.type not in self._fingerprints:
+            # only this content type, the others stay serialized
+            self._compute_fingerprints([content_type.type])
+        return self._fingerprints.get(content_type.type)
+
+    def _get_modules(self, content_type_key):
+        if content_type_key in self._serialized_manifest:
+            # readers don't hold the lock, the modules are published before the serialized copy is dropped
+            with self._lock:
+                serialized_manifest = self._serialized_manifest.get(content_type_key)
+                if serialized_manifest is not None:
+                    self._manifest[content_type_key] = dict(
+                        (module_name, paste_module.Module.deserialize(serialized_module))
+                        for (module_name, serialized_module) in serialized_manifest.iteritems()
+                    )
+                    self._serialized_manifest.pop(content_type_key, None)
+        return self._manifest.setdefault(content_type_key, {})
 
     def get_manifest(self, content_type):
-        return self._manifest.setdefault(content_type.type, {})
+        return self._get_modules(content_type.type)
+
+    def get_dependency_index(self, content_type):
+        index = self._graph.get(content_type.type)
+        if index is None:
+            # manifests built before the index existed only hold the backfilled, transitive dependencies
+            index = paste_graph.DependencyIndex(forward=dict(
+                (module_name, module.dependencies) for module_name, module in self.get_manifest(content_type).iteritems()
+            ))
+            self._graph[content_type.type] = index
+        return index
+
+    def is_built(self, content_type):
+        return content_type.type in self._built_content_types
 
     def get_sorted_deps(self, content_type):
         sorted_deps = self._sorted_deps.get(content_type.type)
-        if not sorted_deps:
-            self._sorted_deps[content_type] = self._sort_modules(
-                [module for (module_name, module) in self.get_manifest(content_type).iteritems()]
-            )
+        if sorted_deps is None:
+            with self._lock:
+                sorted_deps = self._sorted_deps.get(content_type.type)
+                if sorted_deps is None:
+                    sorted_deps = self._sort_modules(
+                        [module for (module_name, module) in self.get_manifest(content_type).iteritems()]
+                    )
+                    self._sorted_deps[content_type.type] = sorted_deps
 
         return sorted_deps
 
     def _path_to_modules(self, path, content_type):
         modules = []
         for dir_path, dir_names, file_names in os.walk(path):
-            dir_names[:] = [dir_name
-                            for dir_name in dir_names
-                            if dir_name not in env.excluded_dirs + (env.build_prefix,)]
-            for module_file in file_names:
+            # sorted so the walk, and which of two modules declaring the same name wins, is the same on every node
+            dir_names[:] = sorted(dir_name
+                                  for dir_name in dir_names
+                                  if dir_name not in env.excluded_dirs + (env.build_prefix,))
+            for module_file in sorted(file_names):
                 if module_file.endswith(content_type.file_extension):
                     module = paste_module.Module(os.path.normpath(dir_path + os.sep + module_file))
                     modules.append(module)
         return modules
 
-    def _clean_unprimed_modules(self, local_manifest):
+    def _clean_unprimed_modules(self, local_manifest, content_type_keys):
         unprimed_modules = [
             (module_name, module, paste_primer.PrimerHelper.get_content_type_primer(
                 content_type_helper.type_to_content_type(content_type_key)
             ))
-            for content_type_key, modules_dict in self._manifest.iteritems()
-            for module_name, module in modules_dict.iteritems()
+            for content_type_key in content_type_keys
+            for module_name, module in self._get_modules(content_type_key).iteritems()
             if not local_manifest.get(content_type_key)
             or not local_manifest.get(content_type_key, {}).get(module_name)]
 
@@ -104,7 +269,7 @@ class Manifest(object):
                 # leave old module names if versioning is on, else delete it
                 del self._manifest[primer.content_type.type][module_name]
 
-    def _prime_modules(self, modules, content_type):
+    def _prime_modules(self, modules, content_type, batch_compilation=None, **options):
         primed_modules = []
         primer = paste_primer.PrimerHelper.get_content_type_primer(content_type)
         if not primer:
@@ -112,12 +277,36 @@ class Manifest(object):
             return primed_modules
 
         existing_manifest = self.get_manifest(content_type)
-        for index, module in enumerate(modules):
-            primed_module = primer.prime(module, existing_manifest=existing_manifest)
+        batch_compilation = env.batch_compilation if batch_compilation is None else batch_compilation
+        direct_dependencies = self._direct_dependencies.setdefault(content_type.type, {})
+        if batch_compilation and hasattr(primer, 'prime_batch'):
+            for module in modules:
+                primer.parse_module(module)
+                if module.name:
+                    direct_dependencies[module.name] = list(module.dependencies)
+            modules_by_name = dict((module.name, module) for module in modules if module.name)
+            primed = primer.prime_batch(
+                [modules_by_name[module_name]
+                 for (module_name, _, _) in self._sort_modules(modules_by_name.values())
+                 if module_name in modules_by_name],
+                existing_manifest=existing_manifest
+            )
+        else:
+            primed = (primer.prime(module, existing_manifest=existing_manifest) for module in modules)
 
+        for primed_module in primed:
             if primed_module:
                 if None in primed_module.dependencies:
                     log.error('Dependency of NoneType found in %s.' % primed_module.source_path)
+                direct_dependencies.setdefault(primed_module.name, list(primed_module.dependencies))
+                primed_module.inline_contents = None
+                if not env.compile_mode and primed_module.byte_size is not None \
+                        and primed_module.byte_size < env.network_request_threshold:
+                    primed_module.inline_contents = primer.escape_inline(primed_module.contents)
+                existing_module = existing_manifest.get(primed_module.name)
+                if existing_module is not None and primed_module.version > existing_module.version:
+                    # bump_version ran, so the module has a newly replaced version to collect
+                    self._gc_pending.add((content_type.type, primed_module.name))
                 primed_modules.append(primed_module)
         return primed_modules
 
@@ -176,43 +365,230 @@ class Manifest(object):
 
         return sorted_module_paths
 
-    def build(self, **options):
+    def build(self, content_types=None, **options):
+        with self._lock:
+            content_type_keys = self._build(content_types=content_types, **options)
+            self._snapshots = dict((content_type_key, snapshot)
+                                   for content_type_key, snapshot in self._snapshots.iteritems()
+                                   if content_type_key not in content_type_keys)
+
+    def _build(self, content_types=None, **options):
+        # content_types limits the scan, priming and sorting to those content types, leaving the rest as is
+        content_type_paths = [
+            (content_type, path) for content_type, path in env.content_type_paths + env.internal_lib_paths
+            if content_types is None or content_type in content_types
+        ]
+        content_type_keys = set(content_type.type for content_type in content_types) \
+            if content_types is not None else set(self._manifest) | set(self._serialized_manifest)
+
         local_manifest = {}
-        for content_type, path in env.content_type_paths + env.internal_lib_paths:
+        for content_type, path in content_type_paths:
             raw_modules = self._path_to_modules(path, content_type)
             primed_modules = self._prime_modules(raw_modules, content_type, **options)
 
             local_manifest[content_type.type] = local_manifest.get(content_type.type, {})
-            self._manifest[content_type.type] = self._manifest.get(content_type.type, {})
+            content_type_keys.add(content_type.type)
 
             content_type_module_dict = dict((module.name, module) for module in primed_modules)
             local_manifest[content_type.type].update(content_type_module_dict)
-            self._manifest[content_type.type].update(content_type_module_dict)
+            self._get_modules(content_type.type).update(content_type_module_dict)
 
-        self._clean_unprimed_modules(local_manifest)
-        self._sorted_deps = dict(
+        self._clean_unprimed_modules(local_manifest, content_type_keys)
+        self._index_dependencies(content_type_keys)
+        for content_type_key in content_type_keys:
+            self._sorted_deps[content_type_key] = self._sort_modules(
+                [module for (module_name, module) in self._get_modules(content_type_key).iteritems()]
+            )
+        self._built_content_types |= content_type_keys
+        self._compute_fingerprints(content_type_keys)
+        self._upload_artifacts(content_type_keys)
+
+        if not env.compile_mode:
+            self._report = self._report.merge(
+                paste_report.BuildReport.from_manifest(self, content_type_keys, previous=self._report))
+
+        return content_type_keys
+
+    @property
+    def report(self):
+        return self._report
+
+    @property
+    def previous_report(self):
+        # the report of the saved manifest this one was loaded from, None for a manifest built from scratch
+        return self._previous_report
+
+    def check_budgets(self, budgets=None):
+        return self._report.check_budgets(env.size_budgets if budgets is None else budgets,
+                                          previous=self._previous_report)
+
+    def enforce_budgets(self, budgets=None):
+        self._report.enforce(env.size_budgets if budgets is None else budgets, previous=self._previous_report)
+
+    def _index_dependencies(self, content_type_keys):
+        # must run before _sort_modules, which backfills transitive dependencies into the modules
+        for content_type_key in content_type_keys:
+            direct_dependencies = self._direct_dependencies.pop(content_type_key, {})
+            previous_index = self._graph.get(content_type_key)
+            forward = {}
+            for module_name, module in self._get_modules(content_type_key).iteritems():
+                if module_name in direct_dependencies:
+                    forward[module_name] = direct_dependencies[module_name]
+                elif previous_index is not None and module_name in previous_index.forward:
+                    forward[module_name] = previous_index.forward[module_name]
+                else:
+                    forward[module_name] = list(module.dependencies)
+            self._graph[content_type_key] = paste_graph.DependencyIndex(forward=forward)
+
+    def _upload_artifacts(self, content_type_keys):
+        artifact_store = env.artifact_store
+        if artifact_store is None or env.compile_mode:
+            return
+
+        artifacts = {}
+        for content_type_key in content_type_keys:
+            for module in self._get_modules(content_type_key).itervalues():
+                artifact_key = paste_store.artifact_key(module)
+                if not module.path or not artifact_key:
+                    continue
+                artifacts[artifact_key] = module.abs_path
+                if module.source_map_path:
+                    artifacts[paste_sourcemap.map_path(artifact_key)] = module.abs_source_map_path
+        failures = artifact_store.put_many(sorted(artifacts.iteritems()))
+        if failures:
+            log.error('Failed uploading %d of %d artifacts' % (len(failures), len(artifacts)))
+
+    def fetch_artifacts(self, content_type):
+        with self._lock:
+            return self._fetch_artifacts(content_type)
+
+    def _fetch_artifacts(self, content_type):
+        # pulls only the primed files this manifest references and that are missing locally
+        artifact_store = env.artifact_store
+        if artifact_store is None or env.compile_mode or content_type.type in self._fetched_content_types:
+            return []
+
+        missing_modules = [module for module in self.get_manifest(content_type).itervalues()
+                           if module.declared_path and paste_store.artifact_key(module, module.declared_path)]
+        artifacts = sorted(set(
             (
-                content_type_key,
-                self._sort_modules([module for (module_name, module) in module_dict.iteritems()])
-            ) for (content_type_key, module_dict) in self._manifest.iteritems()
-        )
+                paste_store.artifact_key(module, module.declared_path),
+                os.path.normpath(os.path.normpath(env.app_root) + os.sep + module.declared_path)
+            ) for module in missing_modules
+        ))
+        failures = artifact_store.fetch_many(artifacts)
+        if env.source_maps:
+            # modules primed before source maps were turned on have none, so a missing map isn't a failure
+            failures += artifact_store.fetch_many([
+                (paste_sourcemap.map_path(artifact_key), paste_sourcemap.map_path(abs_path))
+                for artifact_key, abs_path in artifacts
+            ], optional=True)
+        for module in missing_modules:
+            module.resolve_declared_path()
+
+        if failures:
+            log.error('Failed fetching %d of %d artifacts, retrying in %ds' % (
+                len(failures), len(missing_modules), self.FETCH_RETRY_INTERVAL))
+            self._fetch_retry_at[content_type.type] = time.time() + self.FETCH_RETRY_INTERVAL
+        else:
+            self._fetched_content_types.add(content_type.type)
+            self._fetch_retry_at.pop(content_type.type, None)
+        return failures
+
+    def _fetch_due(self, content_type):
+        # a failed fetch is retried once FETCH_RETRY_INTERVAL has passed, the current snapshot is served meanwhile
+        retry_at = self._fetch_retry_at.get(content_type.type)
+        return retry_at is not None and time.time() >= retry_at
+
+    def collect(self, keep_versions=None, max_age=None, dry_run=False, full=False):
+        with self._lock:
+            return self._collect(keep_versions=keep_versions, max_age=max_age, dry_run=dry_run, full=full)
+
+    def _collect(self, keep_versions=None, max_age=None, dry_run=False, full=False):
+        keep_versions = env.version_retention_count if keep_versions is None else keep_versions
+        max_age = env.version_retention_age if max_age is None else max_age
+
+        report = CollectionReport(dry_run=dry_run)
+        if keep_versions is None and max_age is None:
+            return report
+
+        if full:
+            pending = set((content_type_key, module_name)
+                          for content_type_key in set(self._manifest) | set(self._serialized_manifest)
+                          for module_name in self._get_modules(content_type_key))
+        else:
+            # only modules that gained a version since the last pass can have anything to collect
+            pending = self._gc_pending
+
+        now = time.time()
+        still_pending = set()
+        for content_type_key, module_name in sorted(pending):
+            module = self._get_modules(content_type_key).get(module_name)
+            if module is None:
+                continue
+
+            expired_versions = module.expired_versions(keep_versions=keep_versions, max_age=max_age, now=now)
+            for serialized_ver in expired_versions:
+                path = serialized_ver.get('path')
+                if not path or path == module.path:
+                    continue
+
+                abs_path = os.path.normpath(os.path.normpath(env.app_root) + os.sep + path)
+                for collected_path in (abs_path, paste_sourcemap.map_path(abs_path)):
+                    if os.path.exists(collected_path):
+                        report.add(collected_path, os.path.getsize(collected_path))
+                        if not dry_run:
+                            log.debug('Collecting primed_path=%s; source=%s.' % (collected_path, module.source_path))
+                            os.remove(collected_path)
+            report.trimmed_versions += len(expired_versions)
+
+            if not dry_run:
+                module.trim_versions(expired_versions)
+
+            # age based retention may expire the remaining versions on a later pass
+            if max_age is not None and module.serialized_versions:
+                still_pending.add((content_type_key, module_name))
+
+        if not dry_run:
+            self._gc_pending = still_pending if full else (self._gc_pending - pending) | still_pending
+
+        return report
 
     def serialize(self):
+        serialized_manifest = dict(
+            (
+                content_type,
+                dict((module_name, module.serialize())
+                     for (module_name, module) in content_type_manifest.iteritems())
+            ) for (content_type, content_type_manifest) in self._manifest.iteritems()
+        )
+        # content types that were never used are written back without being deserialized
+        serialized_manifest.update(self._serialized_manifest)
         return {
-            'manifest': dict(
-                (
-                    content_type,
-                    dict((module_name, module.serialize())
-                         for (module_name, module) in content_type_manifest.iteritems())
-                ) for (content_type, content_type_manifest) in self._manifest.iteritems()
-            ),
-            'sorted_deps': self._sorted_deps
+            'manifest': serialized_manifest,
+            'sorted_deps': self._sorted_deps,
+            'gc_pending': sorted(self._gc_pending),
+            'fingerprints': self._fingerprints,
+            'report': self._report.serialize(),
+            'graph': dict((content_type_key, index.serialize())
+                          for content_type_key, index in self._graph.iteritems())
         }
 
     def save(self):
-        build_file = open(self._build_path(), 'wb')
+        serialized = self.serialize()
+        self._write_pickle(self._build_path(), serialized)
+        self._write_pickle(paste_graph.index_path(self._build_path()), serialized['graph'])
+
+    @classmethod
+    def _write_pickle(cls, path, obj):
+        if env.reproducible_builds:
+            contents = paste_reproducible.dumps(obj)
+        else:
+            contents = cPickle.dumps(obj, protocol=cPickle.HIGHEST_PROTOCOL)
+
+        build_file = open(path, 'wb')
         try:
-            build_file.write(cPickle.dumps(self.serialize(), protocol=cPickle.HIGHEST_PROTOCOL))
+            build_file.write(contents)
         finally:
             build_file.close()
 
@@ -226,22 +602,27 @@ class Manifest(object):
 
     @classmethod
     def deserialize(cls, obj):
-        manifest = dict(
-            (content_type, dict(
-                (module_name, paste_module.Module.deserialize(serialized_module))
-                for (module_name, serialized_module) in serialized_manifest.iteritems()
-            ))
-            for (content_type, serialized_manifest) in obj.get('manifest', {}).iteritems()
-        )
+        # modules are deserialized per content type on first use, see _get_modules
+        serialized_manifest = dict(obj.get('manifest', {}))
         return cls(
-            manifest=manifest,
-            sorted_deps=obj.get('sorted_deps', None)
+            sorted_deps=obj.get('sorted_deps', None),
+            gc_pending=obj.get('gc_pending', None),
+            fingerprints=obj.get('fingerprints', None),
+            report=obj.get('report', None),
+            graph=obj.get('graph', None),
+            serialized_manifest=serialized_manifest,
+            built_content_types=set(serialized_manifest) | set(
+                primer.content_type.type for primer in paste_primer.PrimerHelper.primers
+            )
         )
 
     @classmethod
     def load(cls):
-        if cls._instance is None:
-            if not env.compile_mode and os.path.exists(cls._build_path()):
+        if cls._instance is not None:
+            return cls._instance
+
+        with cls._lock:
+            if cls._instance is None and not env.compile_mode and os.path.exists(cls._build_path()):
                 try:
                     read_file = open(cls._build_path(), "rb")
                 except Exception, e:
@@ -256,24 +637,49 @@ class Manifest(object):
 
         return cls._instance
 
-    @classmethod
-    def get_content_type_manifest(cls, content_type):
-        try:
-            instance = cls.load()
-        except cls.OpenException, e:
-            instance = None
-            log.error('Error opening manifest file. e=' + traceback.format_exc())
-        except cls.ParseException, e:
-            instance = None
-            log.error('Error parsing manifest file. e=' + traceback.format_exc())
-
-        if instance is None:
-            log.error('Creating manifest from scratch')
-            instance = Manifest()
-            instance.build()
-            cls._instance = instance
-
+    def _snapshot(self, content_type):
+        # copies down to the modules, so a later build, collect or fetch can't change a snapshot being served
         return ContentTypeManifest(
             content_type,
-            instance.get_manifest(content_type), instance.get_sorted_deps(content_type)
+            dict((module_name, module.copy()) for module_name, module in self.get_manifest(content_type).iteritems()),
+            list(self.get_sorted_deps(content_type) or []),
+            fingerprint=self.get_fingerprint(content_type),
+            manifest_fingerprint=self.fingerprint
         )
+
+    @classmethod
+    def get_content_type_manifest(cls, content_type):
+        instance = cls._instance
+        snapshot = instance._snapshots.get(content_type.type) if instance is not None else None
+        if snapshot is not None and not instance._fetch_due(content_type):
+            return snapshot
+
+        # single flight: the first thread loads or builds, the others wait for it and reuse the result
+        with cls._lock:
+            try:
+                instance = cls.load()
+            except cls.OpenException, e:
+                instance = None
+                log.error('Error opening manifest file. e=' + traceback.format_exc())
+            except cls.ParseException, e:
+                instance = None
+                log.error('Error parsing manifest file. e=' + traceback.format_exc())
+
+            if instance is None:
+                log.error('Creating manifest from scratch')
+                instance = Manifest()
+                cls._instance = instance
+
+            snapshot = instance._snapshots.get(content_type.type)
+            if snapshot is None or instance._fetch_due(content_type):
+                if not instance.is_built(content_type):
+                    # only the requested content type is built, the others are built on first use
+                    instance.build(content_types=[content_type])
+                instance.fetch_artifacts(content_type)
+
+                snapshot = instance._snapshot(content_type)
+                snapshots = dict(instance._snapshots)
+                snapshots[content_type.type] = snapshot
+                instance._snapshots = snapshots
+
+        return snapshot
@@ -1,3 +1,4 @@
+import copy
 import cPickle
 import hashlib
 import operator
@@ -5,15 +6,16 @@ import traceback
 import os
 import re
 import stat
-import sys
+import time
 
 import logging
 log = logging.getLogger('paste')
 
 from ..util import OrderedSet, content_type_helper
 
-from .runtime import Runtime
-env = Runtime.get().env
+from .runtime import env
+
+from . import content as paste_content, sourcemap as paste_sourcemap
 
 
 class Module(object):
@@ -21,7 +23,7 @@ class Module(object):
 
     def __init__(self, source_path, source_checksum=None, name=None, dependencies=None,
                  last_modified=None, checksum=None, path=None, byte_size=None, version=None,
-                 prev_versions=None, version_removed=None):
+                 prev_versions=None, version_removed=None, compression_time=None, inline_contents=None):
 
         super(Module, self).__init__()
 
@@ -44,11 +46,15 @@ class Module(object):
 
         # if a final path has been supplied, make sure it's legit
         self._path = None
+        self._declared_path = None
         if path:
-            if os.path.isabs(path) and os.path.exists(path):
-                self._path = os.path.relpath(path, os.path.normpath(env.app_root))
-            elif os.path.exists(os.path.normpath(os.path.normpath(env.app_root) + os.sep + path)):
+            if os.path.isabs(path):
+                path = os.path.relpath(path, os.path.normpath(env.app_root))
+            if os.path.exists(os.path.normpath(os.path.normpath(env.app_root) + os.sep + path)):
                 self._path = path
+            else:
+                # not primed on this node, it may still be fetched from the artifact store
+                self._declared_path = path
         path_contents = self._read_file(self._path) if self._path and (checksum or byte_size) else None
 
         if path_contents and checksum:
@@ -59,7 +65,7 @@ class Module(object):
         self._checksum = checksum
 
         if path_contents and byte_size:
-            path_byte_size = sys.getsizeof(path_contents, 0)
+            path_byte_size = len(path_contents)
             if path_byte_size != byte_size:
                 log.debug(
                     u'Byte sizes do not match, keeping passed value. path=%s; path_byte_size="%s; byte_size=%s' % (
@@ -75,6 +81,9 @@ class Module(object):
         self._last_modified = last_modified
 
         self._version_removed = version_removed
+        self._compression_time = compression_time
+        # primed contents escaped for embedding in the page, only set for modules under the request threshold
+        self._inline_contents = inline_contents
 
     def __hash__(self):
         return hash(cPickle.dumps(sorted(self.serialize().iteritems(), key=operator.itemgetter(1)),
@@ -119,16 +128,35 @@ class Module(object):
 
     @property
     def contents(self):
+        # primed contents read back from disk go through the bounded content cache rather than being
+        # pinned on the module for the life of the process. files over the cache entry size are read on every
+        # access, so callers needing them more than once keep the result or use view_contents
         if self._contents is None and self._path:
-            self._contents = self._read_file(self._path)
+            return paste_content.read_primed(self.abs_path)
         return self._contents
 
+    def view_contents(self):
+        if self._contents is not None:
+            return buffer(self._contents)
+        return paste_content.view_primed(self.abs_path) if self._path else None
+
+    def open_contents(self):
+        return paste_content.open_primed(self.abs_path) if self._path else None
+
+    def copy(self):
+        # shares nothing a build, collect or fetch rebinds or changes in place, e.g. for a published snapshot
+        module = copy.copy(self)
+        module._dependencies = OrderedSet(self._dependencies)
+        module._prev_versions = list(self._prev_versions)
+        return module
+
     def coalesce(self, existing_module):
         if isinstance(existing_module, Module):
             self.version = existing_module.version
             self._prev_versions = existing_module.serialized_versions
             self._version_removed = existing_module.version_removed
             self._last_modified = existing_module.last_modified
+            self._compression_time = existing_module.compression_time
         else:
             log.warning(
                 'Failure setting existing module values for source_path=%s' % self.source_path
@@ -138,7 +166,7 @@ class Module(object):
         if contents:
             self._contents = contents
             self._checksum = hashlib.md5(self._contents).hexdigest()
-            self._byte_size = self._byte_size = sys.getsizeof(self._contents, 0)
+            self._byte_size = len(self._contents)
 
             content_type = content_type_helper.filename_to_content_type(self.source_path)
             if not content_type:
@@ -181,6 +209,22 @@ class Module(object):
     def byte_size(self):
         return self._byte_size
 
+    @property
+    def compression_time(self):
+        return self._compression_time
+
+    @compression_time.setter
+    def compression_time(self, value):
+        self._compression_time = value
+
+    @property
+    def inline_contents(self):
+        return self._inline_contents
+
+    @inline_contents.setter
+    def inline_contents(self, value):
+        self._inline_contents = value
+
     @property
     def path(self):
         return self._path
@@ -190,6 +234,45 @@ class Module(object):
         return os.path.normpath(os.path.normpath(
             env.app_root) + os.sep + self.path) if self.path else None
 
+    @property
+    def url(self):
+        return self.path_to_url(self._path) if self._path else None
+
+    @classmethod
+    def path_to_url(cls, path):
+        # paths are relative to the app root, but the build area may lie outside it. files there are served
+        # relative to the build area rather than climbing out of env.root_uri with '..'
+        app_root = os.path.normpath(env.app_root)
+        abs_path = os.path.normpath(app_root + os.sep + path)
+        url_path = os.path.relpath(abs_path, app_root)
+        if url_path == os.pardir or url_path.startswith(os.pardir + os.sep):
+            build_area = os.path.normpath(env.build_area or env.app_root)
+            if abs_path.startswith(build_area + os.sep):
+                url_path = os.path.relpath(abs_path, build_area)
+        return env.root_uri.rstrip('/') + '/' + url_path.replace(os.sep, '/')
+
+    @property
+    def source_map_path(self):
+        map_path = paste_sourcemap.map_path(self.path)
+        if map_path and os.path.exists(os.path.normpath(os.path.normpath(env.app_root) + os.sep + map_path)):
+            return map_path
+        return None
+
+    @property
+    def abs_source_map_path(self):
+        return paste_sourcemap.map_path(self.abs_path) if self.source_map_path else None
+
+    @property
+    def declared_path(self):
+        return self._declared_path
+
+    def resolve_declared_path(self):
+        if self._declared_path and os.path.exists(
+                os.path.normpath(os.path.normpath(env.app_root) + os.sep + self._declared_path)):
+            self._path = self._declared_path
+            self._declared_path = None
+        return self._path
+
     @property
     def last_modified(self):
         if self._last_modified is None and self.abs_path:
@@ -198,10 +281,7 @@ class Module(object):
         return self._last_modified
 
     def pop_versions(self):
-        prev_versions = []
-        for i, serialized_ver in enumerate(self._prev_versions):
-            prev_versions.append(self._prev_versions.pop(i))
-
+        prev_versions, self._prev_versions = self._prev_versions, []
         return prev_versions
 
     @property
@@ -222,6 +302,40 @@ class Module(object):
     def serialized_versions(self):
         return self._prev_versions
 
+    def expired_versions(self, keep_versions=None, max_age=None, now=None):
+        if keep_versions is None and max_age is None:
+            return []
+
+        now = now if now is not None else time.time()
+        newest_first = sorted(self._prev_versions, key=lambda ver: ver.get('version') or 0, reverse=True)
+
+        expired = []
+        for index, serialized_ver in enumerate(newest_first):
+            if keep_versions is not None and index < keep_versions:
+                continue
+            if max_age is not None:
+                # a version is aged from when it stopped being the current one, not from when it was written
+                replaced_at = serialized_ver.get('replaced_at')
+                if replaced_at is None:
+                    # older and reproducible manifests don't store it, the version after it was written then
+                    successor_path = newest_first[index - 1].get('path') if index else self.path
+                    replaced_at = self._path_last_modified(successor_path)
+                if replaced_at is None or now - replaced_at < max_age:
+                    continue
+            expired.append(serialized_ver)
+
+        return expired
+
+    @classmethod
+    def _path_last_modified(cls, path):
+        abs_path = os.path.normpath(os.path.normpath(env.app_root) + os.sep + path) if path else None
+        return os.stat(abs_path)[stat.ST_MTIME] if abs_path and os.path.exists(abs_path) else None
+
+    def trim_versions(self, expired_versions):
+        expired_ids = set(id(serialized_ver) for serialized_ver in expired_versions)
+        self._prev_versions = [serialized_ver for serialized_ver in self._prev_versions
+                               if id(serialized_ver) not in expired_ids]
+
     def version_from_path(self):
         version = None
         if self._path:
@@ -239,11 +353,15 @@ class Module(object):
     def bump_version(self, module):
         self.version += 1
         self._prev_versions = module.pop_versions()
-        self._prev_versions.append(module.serialize())
+        serialized_ver = module.serialize()
+        serialized_ver['replaced_at'] = time.time()
+        self._prev_versions.append(serialized_ver)
 
     def remove(self, remove_source=False):
         self._version_removed = self.version
         if remove_source and self.abs_path:
+            if self.source_map_path:
+                os.remove(self.abs_source_map_path)
             os.remove(self.abs_path or '')
 
     @property
@@ -262,11 +380,14 @@ class Module(object):
             'dependencies': sorted(self.dependencies),
             'last_modified': self.last_modified,
             'checksum': self.checksum,
-            'path': self.path,
+            # a path not fetched yet is still the module's, dropping it would lose the artifact for good
+            'path': self._path or self._declared_path,
             'byte_size': self.byte_size,
             'version': self.version,
             'prev_versions': self._prev_versions,
-            'version_removed': self._version_removed
+            'version_removed': self._version_removed,
+            'compression_time': self._compression_time,
+            'inline_contents': self._inline_contents
         }
 
     @classmethod
@@ -281,5 +402,7 @@ class Module(object):
                    byte_size=obj.get('byte_size', None),
                    version=obj.get('version', None),
                    prev_versions=obj.get('prev_versions', None),
-                   version_removed=obj.get('version_removed', None)
+                   version_removed=obj.get('version_removed', None),
+                   compression_time=obj.get('compression_time', None),
+                   inline_contents=obj.get('inline_contents', None)
         )
\ No newline at end of file
@@ -5,18 +5,31 @@ import os
 import abc
 import hashlib
 import re
+import shutil
+import tempfile
+import time
 
 import logging
-from paste.service import compressor
 
 log = logging.getLogger('paste')
 
-from ..util import OrderedSet, content_type_helper
+from ..util import OrderedDict, OrderedSet, content_type_helper
 
-from .runtime import Runtime
-env = Runtime.get().env
+from .runtime import env
 
-from . import module as paste_module
+from . import content as paste_content, graph as paste_graph, module as paste_module, sourcemap as paste_sourcemap
+
+
+def _compressor():
+    # the compressor pulls in the closure and scss toolchains, so it is only imported once something is primed
+    from paste.service import compressor
+    return compressor
+
+
+class _LoadPaths(object):
+    # resolved from the env on access rather than at import time
+    def __get__(self, instance, owner):
+        return [path for content_type, path in env.content_type_paths + env.internal_lib_paths]
 
 
 class Primer(object):
@@ -74,11 +87,16 @@ class Primer(object):
                     module.source_path
                 ))
                 os.remove(existing_module.abs_path)
+                if existing_module.source_map_path:
+                    os.remove(existing_module.abs_source_map_path)
 
     @abc.abstractmethod
     def prime(self, module, existing_manifest=None):
         return paste_module.Module.deserialize(module.serialize())
 
+    def escape_inline(self, contents):
+        return contents
+
     def unprime(self, module):
         if module.abs_path and os.path.exists(module.abs_path):
             log.debug('Removing unprimed module path=%s; source=%s; versioning:%s' % (
@@ -89,21 +107,44 @@ class Primer(object):
             module.remove(remove_source=not env.versioning)
         return module
 
+    def _write_primed(self, module, source_map=None):
+        compressed_file = open(module.abs_path, 'wb')
+        try:
+            compressed_file.write(module.contents)
+        finally:
+            compressed_file.close()
+
+        if source_map:
+            paste_sourcemap.write_map(module.abs_path, paste_sourcemap.normalize_map(
+                source_map, module.source_path, os.path.basename(module.path), root=env.app_root
+            ))
+
+    @classmethod
+    def _primed_abs_path(cls, path):
+        return os.path.normpath(os.path.normpath(env.app_root) + os.sep + path)
+
     @classmethod
     def read_primed(cls, path):
-        content_file = open(os.path.normpath(os.path.normpath(env.app_root) + os.sep + path), "rb")
         try:
-            contents = content_file.read()
+            contents = paste_content.read_primed(cls._primed_abs_path(path))
         except IOError, e:
             contents = ''
             log.warning('Could not read file %s. e=%s' % (path, traceback.format_exc()))
-        finally:
-            content_file.close()
 
         return contents
 
+    @classmethod
+    def view_primed(cls, path):
+        return paste_content.view_primed(cls._primed_abs_path(path))
+
+    @classmethod
+    def open_primed(cls, path):
+        return paste_content.open_primed(cls._primed_abs_path(path))
+
 
 class JavascriptPrimer(Primer):
+    ADVANCED_OPTIMIZATIONS = 'ADVANCED_OPTIMIZATIONS'
+    INLINE_ESCAPE_EXPR = re.compile(r'<(/script|!--)', re.I)
     JS_COMMENT_EXPR = re.compile(r'/\*\*.*?@(?:module|require).*?\*/', re.S | re.M)
     JSDOC_MODULE_EXPR = re.compile(r'@(?P<type>module|requires)\s(?P<name>[\w||/.].+)')
     CLOSURE_COMPILATION_EXPR = re.compile(r'@(?P<type>compilation_level)\s(?P<value>[\w].+)')
@@ -132,14 +173,24 @@ class JavascriptPrimer(Primer):
 
         return module_name, dependencies, closure_compilation_level
 
-    def prime(self, module, existing_manifest=None, build_docs=False):
-        closure_compilation_level = None
+    def escape_inline(self, contents):
+        # '<\/script' and '<\!--' mean the same to the js parser but can't end or confuse the script element.
+        # '<!--' must be escaped too, '<!-- <script>' keeps the element's own '</script>' from closing it.
+        # the compressor strips comments, html-like (annex b) ones included, so what's left is in strings and regexes
+        return self.INLINE_ESCAPE_EXPR.sub(lambda match: '<\\' + match.group(1), contents)
 
+    def parse_module(self, module):
+        module_name, dependencies, closure_compilation_level = self._parse_file(module.source_contents)
         if not module.name or not module.dependencies:
-            module_name, dependencies, closure_compilation_level = self._parse_file(module.source_contents)
-
             module.name = module_name
             module.dependencies = dependencies
+        return closure_compilation_level
+
+    def prime(self, module, existing_manifest=None, build_docs=False):
+        closure_compilation_level = None
+
+        if not module.name or not module.dependencies:
+            closure_compilation_level = self.parse_module(module)
 
         if not module.name:
             log.debug('Cannot parse module name, skipping path %s' % module.source_path)
@@ -156,37 +207,190 @@ class JavascriptPrimer(Primer):
                 self.set_primed_content(existing_module, module, module.source_contents, module.source_path)
             else:
                 primed_contents = None
+                compression_start = time.time()
                 try:
-                    primed_contents = '%s' % (
-                        compressor.compress(
-                            module.source_contents, 'js', '--compilation_level ' + closure_compilation_level
+                    # the map comes out of the same compiler invocation
+                    with paste_sourcemap.TemporaryMap(enabled=env.source_maps) as source_map:
+                        args = ['--compilation_level ' + closure_compilation_level]
+                        if source_map.path:
+                            args += ['--create_source_map ' + source_map.path, '--source_map_format V3']
+                        primed_contents = '%s' % (
+                            _compressor().compress(module.source_contents, 'js', *args)
                         )
-                    )
                 finally:
                     if not primed_contents:
                         log.warning('Priming failure at:  %s' % module.source_path)
 
                 self.set_primed_content(existing_module, module, primed_contents)
-
-                compressed_file = open(module.abs_path, 'wb')
-                try:
-                    compressed_file.write(module.contents)
-                finally:
-                    compressed_file.close()
+                module.compression_time = time.time() - compression_start
+                self._write_primed(module, source_map.source_map)
 
             log.debug('Primed source=%s; primed_path=%s.' % (module.source_path, module.path))
 
         return super(JavascriptPrimer, self).prime(module, existing_manifest)
 
+    @classmethod
+    def _write_source(cls, path, contents):
+        source_file = open(path, 'wb')
+        try:
+            source_file.write(contents)
+        finally:
+            source_file.close()
+
+    def _compress_chunks(self, modules, closure_compilation_level, modules_by_name, dependency_index):
+        # one compiler invocation for the group, each module in its own output chunk. closure requires a single
+        # root chunk that every other chunk depends on, so an empty one is added. dependencies compiled outside
+        # the group are passed as externs, so the group never renames the symbols it uses from them
+        chunk_dir = tempfile.mkdtemp(prefix='paste-chunks-')
+        try:
+            root_path = os.path.join(chunk_dir, 'paste_root.src.js')
+            open(root_path, 'wb').close()
+            args = [
+                '--compilation_level ' + closure_compilation_level,
+                '--chunk_output_path_prefix ' + chunk_dir + os.sep,
+                '--js ' + root_path,
+                '--chunk paste_root:1'
+            ]
+            if env.source_maps:
+                # closure expands %outname% per chunk, giving <chunk>.js.map
+                args += ['--create_source_map ' + os.path.join(chunk_dir, '%outname%.map'),
+                         '--source_map_format V3']
+
+            chunk_names = OrderedDict()
+            # chunk input -> module source, a chunk's map may point into the inputs of the chunks it depends on
+            source_paths = {}
+            externs = set()
+            for index, module in enumerate(modules):
+                chunk_names[module.name] = '%s_%d' % (re.sub(r'\W', '_', module.name), index)
+                source_path = os.path.join(chunk_dir, chunk_names[module.name] + '.src.js')
+                self._write_source(source_path, module.source_contents)
+                source_paths[source_path] = module.source_path
+
+                dependencies = set(dependency_index.dependencies(module.name, transitive=True))
+                externs.update(dependency for dependency in dependencies
+                               if dependency in modules_by_name and dependency not in chunk_names)
+                # modules are in dependency order, so every chunk depended on is already declared
+                chunk_deps = [chunk_name for module_name, chunk_name in chunk_names.iteritems()
+                              if module_name in dependencies] or ['paste_root']
+                args += ['--js ' + source_path,
+                         '--chunk %s:1:%s' % (chunk_names[module.name], ','.join(chunk_deps))]
+
+            for index, module_name in enumerate(sorted(externs)):
+                externs_path = os.path.join(chunk_dir, '%s_%d.externs.js' % (re.sub(r'\W', '_', module_name), index))
+                self._write_source(externs_path, modules_by_name[module_name].source_contents)
+                args.append('--externs ' + externs_path)
+
+            _compressor().compress('', 'js', *args)
+
+            # closure puts the code it injects, $jscomp polyfills and transpilation helpers, in the root chunk.
+            # every chunk depends on it, so it is prepended to each, as compiling them one by one would
+            root_output_path = os.path.join(chunk_dir, 'paste_root.js')
+            runtime = paste_module.Module._read_file(root_output_path, absolute_path=True) \
+                if os.path.exists(root_output_path) else ''
+            if not runtime.strip():
+                runtime = ''
+            elif not runtime.endswith('\n'):
+                runtime += '\n'
+
+            chunk_contents = {}
+            for module_name, chunk_name in chunk_names.iteritems():
+                chunk_path = os.path.join(chunk_dir, chunk_name + '.js')
+                if os.path.exists(chunk_path):
+                    source_map = paste_sourcemap.read_map(paste_sourcemap.map_path(chunk_path))
+                    if source_map:
+                        source_map['sources'] = [source_paths.get(entry, entry)
+                                                 for entry in source_map.get('sources') or []]
+                        # the runtime's lines map to nothing
+                        source_map['mappings'] = ';' * runtime.count('\n') + source_map.get('mappings', '')
+                    chunk_contents[module_name] = (
+                        runtime + paste_module.Module._read_file(chunk_path, absolute_path=True), source_map
+                    )
+            return chunk_contents
+        finally:
+            shutil.rmtree(chunk_dir, ignore_errors=True)
+
+    def _requires_priming(self, module, existing_manifest):
+        existing_module = self.find_existing_module(existing_manifest, module)
+        return not (existing_module and existing_module.path
+                    and existing_module.source_checksum == module.source_checksum
+                    and os.path.exists(existing_module.abs_path))
+
+    def prime_batch(self, modules, existing_manifest=None):
+        # modules must be in dependency order. the modules needing priming are compiled together, one compiler
+        # invocation per compilation level. closure renames symbols differently in every invocation under
+        # ADVANCED_OPTIMIZATIONS, so there a change to any module of the level, or to a dependency it takes
+        # as externs, recompiles the whole level, or the outputs of separate invocations would no longer link
+        if env.compile_mode:
+            return [self.prime(module, existing_manifest) for module in modules]
+
+        primed_modules = OrderedDict()
+        groups = OrderedDict()
+        for module in modules:
+            closure_compilation_level = self.parse_module(module)
+            if module.name:
+                groups.setdefault(closure_compilation_level, []).append(module)
+            else:
+                primed_modules[id(module)] = self.prime(module, existing_manifest)
+        modules_by_name = dict((module.name, module) for module in modules if module.name)
+        dependency_index = paste_graph.DependencyIndex(forward=dict(
+            (module_name, module.dependencies) for module_name, module in modules_by_name.iteritems()))
+        changed_names = set(module_name for module_name, module in modules_by_name.iteritems()
+                            if self._requires_priming(module, existing_manifest))
+        # the changed modules and everything depending on them
+        affected_names = set(dependency_index.affected(changed_names))
+
+        for closure_compilation_level, group in groups.iteritems():
+            compiled = [module for module in group if module.name in changed_names]
+            if closure_compilation_level == self.ADVANCED_OPTIMIZATIONS and any(
+                    module.name in affected_names for module in group):
+                compiled = group
+            compiled_ids = set(id(module) for module in compiled)
+            for module in group:
+                if id(module) not in compiled_ids:
+                    primed_modules[id(module)] = self.prime(module, existing_manifest)
+            if not compiled:
+                continue
+
+            chunk_contents = {}
+            compression_start = time.time()
+            if len(compiled) > 1 or closure_compilation_level == self.ADVANCED_OPTIMIZATIONS:
+                try:
+                    chunk_contents = self._compress_chunks(compiled, closure_compilation_level, modules_by_name,
+                                                           dependency_index)
+                except Exception, e:
+                    log.warning('Batch priming failure, priming modules one by one. e=%s' % traceback.format_exc())
+            # the invocation is shared, so is its cost
+            compression_time = (time.time() - compression_start) / len(compiled)
+
+            for module in compiled:
+                primed_contents, source_map = chunk_contents.get(module.name, (None, None))
+                if not primed_contents:
+                    primed_modules[id(module)] = self.prime(module, existing_manifest)
+                    continue
+
+                existing_module = self.find_existing_module(existing_manifest, module)
+                self.set_primed_content(existing_module, module, primed_contents)
+                module.compression_time = compression_time
+                self._write_primed(module, source_map)
+                log.debug('Primed source=%s; primed_path=%s.' % (module.source_path, module.path))
+                primed_modules[id(module)] = super(JavascriptPrimer, self).prime(module, existing_manifest)
+
+        return [primed_modules[id(module)] for module in modules if id(module) in primed_modules]
+
 
 class SCSSPrimer(Primer):
+    INLINE_ESCAPE_EXPR = re.compile(r'</(style)', re.I)
     MODULE_DEP_EXPR = re.compile(r'@((?P<type>module|requires)\s+"(?P<name>[\w||/.].+?))";')
-    SCSS_LOAD_PATHS = [path for content_type, path in env.content_type_paths + env.internal_lib_paths]
+    SCSS_LOAD_PATHS = _LoadPaths()
 
     @property
     def content_type(self):
         return content_type_helper.SCSS
 
+    def escape_inline(self, contents):
+        # css escapes are resolved inside strings and identifiers, so '<\/style' never closes the element
+        return self.INLINE_ESCAPE_EXPR.sub(lambda match: '<\\/' + match.group(1), contents)
+
     @classmethod
     def _clean_source_contents(cls, source_contents, dependencies=None, module=None):
         def compute_module_replacement(match):
@@ -224,12 +428,17 @@ class SCSSPrimer(Primer):
             # we will run the scss compilation at runtime
             self.set_primed_content(existing_module, module, clean_source_contents, path=module.source_path)
         else:
-            primed_contents = compressor.compress(
-                clean_source_contents,
-                'css',
-                '--compress',
-                load_paths=self.SCSS_LOAD_PATHS
-            )
+            compression_start = time.time()
+            with paste_sourcemap.TemporaryMap(enabled=env.source_maps) as source_map:
+                compress_options = {'load_paths': self.SCSS_LOAD_PATHS}
+                if source_map.path:
+                    compress_options['source_map_path'] = source_map.path
+                primed_contents = _compressor().compress(
+                    clean_source_contents,
+                    'css',
+                    '--compress',
+                    **compress_options
+                )
             if not primed_contents:
                 log.warning('Priming failure at:  %s' % module.source_path)
                 return None
@@ -244,13 +453,10 @@ class SCSSPrimer(Primer):
                 )
 
             self.set_primed_content(existing_module, module, cleaned_primed_contents)
+            module.compression_time = time.time() - compression_start
 
             if not os.path.exists(module.abs_path):
-                compressed_file = open(module.abs_path, 'wb')
-                try:
-                    compressed_file.write(module.contents)
-                finally:
-                    compressed_file.close()
+                self._write_primed(module, source_map.source_map)
 
                 log.debug('Primed source=%s; primed_path=%s.' % (module.source_path, module.path))
 
@@ -260,13 +466,20 @@ class SCSSPrimer(Primer):
     def read_primed(cls, path):
         contents = super(SCSSPrimer, cls).read_primed(path)
         if env.compile_mode:
-            contents = compressor.compress(
+            contents = _compressor().compress(
                 cls._clean_source_contents(contents),
                 'css',
                 load_paths=cls.SCSS_LOAD_PATHS
             )
         return contents
 
+    @classmethod
+    def view_primed(cls, path):
+        if env.compile_mode:
+            # the source is compiled on read in compile mode, so there is no file to map
+            return buffer(cls.read_primed(path))
+        return super(SCSSPrimer, cls).view_primed(path)
+
 
 class CSSPrimer(SCSSPrimer):
     @property
@@ -0,0 +1,173 @@
+import fnmatch
+import hashlib
+import zlib
+
+import logging
+
+log = logging.getLogger('paste')
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+METRICS = ('raw', 'gzip', 'brotli', 'compression_time')
+GROWTH_SUFFIX = '_growth'
+
+
+def _gzip_size(contents):
+    # wbits of 31 gives a gzip container, which is what goes over the wire
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 31)
+    return len(compressor.compress(contents) + compressor.flush())
+
+
+def _brotli_size(contents):
+    return len(brotli.compress(contents)) if brotli is not None else None
+
+
+class BuildReport(object):
+    class BudgetException(Exception):
+        def __init__(self, violations):
+            super(BuildReport.BudgetException, self).__init__('\n'.join(violations))
+            self.violations = violations
+
+    def __init__(self, entries=None):
+        super(BuildReport, self).__init__()
+        # content type -> entry module name -> metric -> value
+        self.entries = entries or {}
+
+    @classmethod
+    def _entry_metrics(cls, module, modules_dict, sorted_names, contents, previous_metrics=None):
+        # dependencies are transitive once the manifest has sorted them, so this is the full payload
+        payload_names = [module_name for module_name in sorted_names
+                         if module_name in module.dependencies and module_name in modules_dict]
+        payload_modules = [modules_dict[module_name] for module_name in payload_names] + [module]
+
+        metrics = {
+            # primed files are content addressed, so this identifies the payload without reading it
+            'payload_checksum': hashlib.md5('|'.join(payload_module.checksum or ''
+                                                     for payload_module in payload_modules)).hexdigest(),
+            'compression_time': sum(payload_module.compression_time or 0 for payload_module in payload_modules)
+        }
+        if previous_metrics and previous_metrics.get('payload_checksum') == metrics['payload_checksum'] \
+                and (brotli is None or previous_metrics.get('brotli') is not None):
+            # an unchanged payload keeps the sizes measured by the build that last changed it
+            metrics.update((metric, previous_metrics.get(metric)) for metric in ('raw', 'gzip', 'brotli'))
+            return metrics
+
+        payload = '\n'.join(cls._module_contents(payload_module, contents) for payload_module in payload_modules)
+        metrics.update({
+            'raw': len(payload),
+            'gzip': _gzip_size(payload),
+            'brotli': _brotli_size(payload)
+        })
+        return metrics
+
+    @classmethod
+    def _module_contents(cls, module, contents):
+        # a shared dependency is part of many payloads, read it once rather than once per entry
+        if module.name not in contents:
+            contents[module.name] = module.contents or ''
+        return contents[module.name]
+
+    @classmethod
+    def from_manifest(cls, manifest, content_type_keys, previous=None):
+        # only entries whose payload changed since previous are measured again
+        previous_entries = previous.entries if previous else {}
+        entries = {}
+        for content_type_key in content_type_keys:
+            modules_dict = manifest._get_modules(content_type_key)
+            sorted_names = [module_name for (module_name, _, _) in manifest._sorted_deps.get(content_type_key) or []]
+            depended_on = set(dependency for module in modules_dict.itervalues() for dependency in module.dependencies)
+            contents = {}
+
+            entries[content_type_key] = dict(
+                (module_name, cls._entry_metrics(module, modules_dict, sorted_names, contents,
+                                                 previous_entries.get(content_type_key, {}).get(module_name)))
+                for module_name, module in modules_dict.iteritems()
+                if module_name not in depended_on and not module.removed
+            )
+        return cls(entries)
+
+    def merge(self, other):
+        entries = dict(self.entries)
+        entries.update(other.entries)
+        return BuildReport(entries)
+
+    def diff(self, previous):
+        # content type -> module name -> metric -> (previous, current), only changed values are listed
+        previous_entries = previous.entries if previous else {}
+        changes = {}
+        for content_type_key, modules_dict in self.entries.iteritems():
+            for module_name, metrics in modules_dict.iteritems():
+                previous_metrics = previous_entries.get(content_type_key, {}).get(module_name, {})
+                changed = dict(
+                    (metric, (previous_metrics.get(metric), metrics.get(metric)))
+                    for metric in METRICS
+                    if metric != 'compression_time' and previous_metrics.get(metric) != metrics.get(metric)
+                )
+                if changed:
+                    changes.setdefault(content_type_key, {})[module_name] = changed
+        return changes
+
+    def check_budgets(self, budgets, previous=None):
+        # budgets map module name patterns to limits, e.g. {'app.*': {'gzip': 50000, 'gzip_growth': 0.05}}.
+        # plain metric limits are absolute, <metric>_growth limits are relative to the previous report
+        previous_entries = previous.entries if previous else {}
+        violations = []
+        for content_type_key, modules_dict in sorted(self.entries.iteritems()):
+            for module_name, metrics in sorted(modules_dict.iteritems()):
+                for pattern, limits in sorted((budgets or {}).iteritems()):
+                    if not fnmatch.fnmatchcase(module_name, pattern):
+                        continue
+
+                    for limit_name, limit in sorted(limits.iteritems()):
+                        metric = limit_name[:-len(GROWTH_SUFFIX)] if limit_name.endswith(GROWTH_SUFFIX) else limit_name
+                        value = metrics.get(metric)
+                        if value is None:
+                            continue
+
+                        if metric == limit_name:
+                            if value > limit:
+                                violations.append('%s %s: %s=%s exceeds budget %s (%s)' % (
+                                    content_type_key, module_name, metric, value, limit, pattern))
+                            continue
+
+                        previous_value = previous_entries.get(content_type_key, {}).get(module_name, {}).get(metric)
+                        if previous_value and float(value - previous_value) / previous_value > limit:
+                            violations.append('%s %s: %s grew from %s to %s, over the %d%% budget (%s)' % (
+                                content_type_key, module_name, metric, previous_value, value, limit * 100, pattern))
+        return violations
+
+    def enforce(self, budgets, previous=None):
+        violations = self.check_budgets(budgets, previous=previous)
+        if violations:
+            raise self.BudgetException(violations)
+
+    def format(self, previous=None):
+        previous_entries = previous.entries if previous else {}
+        lines = []
+        for content_type_key, modules_dict in sorted(self.entries.iteritems()):
+            for module_name, metrics in sorted(modules_dict.iteritems()):
+                previous_metrics = previous_entries.get(content_type_key, {}).get(module_name, {})
+                lines.append('%s %s raw=%s%s gzip=%s%s brotli=%s%s compression_time=%.3fs' % (
+                    content_type_key, module_name,
+                    metrics['raw'], self._format_delta(metrics['raw'], previous_metrics.get('raw')),
+                    metrics['gzip'], self._format_delta(metrics['gzip'], previous_metrics.get('gzip')),
+                    metrics['brotli'], self._format_delta(metrics['brotli'], previous_metrics.get('brotli')),
+                    metrics['compression_time'] or 0
+                ))
+        return '\n'.join(lines)
+
+    @classmethod
+    def _format_delta(cls, value, previous_value):
+        if value is None or previous_value is None or value == previous_value:
+            return ''
+        return ' (%+d)' % (value - previous_value)
+
+    def serialize(self):
+        return self.entries
+
+    @classmethod
+    def deserialize(cls, obj):
+        return cls(obj)
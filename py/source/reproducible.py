@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+import cPickle
+import cStringIO
+import hashlib
+import os
+import sys
+
+from ..util import OrderedDict
+
+# wall clock values that differ between otherwise identical builds
+VOLATILE_FIELDS = ('last_modified', 'compression_time', 'replaced_at')
+
+
+def canonicalize(obj):
+    # sorted mappings and no volatile fields, so equal builds pickle to equal bytes
+    if isinstance(obj, dict):
+        return OrderedDict(
+            (key, None if key in VOLATILE_FIELDS else canonicalize(value))
+            for key, value in sorted(obj.iteritems(), key=lambda item: item[0])
+        )
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(canonicalize(value) for value in obj)
+    if isinstance(obj, (set, frozenset)):
+        return sorted(canonicalize(value) for value in obj)
+    return obj
+
+
+def dumps(serialized):
+    # the pickle memo refers back to objects by identity, so equal manifests sharing objects differently would
+    # pickle to different bytes. the canonical form is a tree, so it is written without one
+    output = cStringIO.StringIO()
+    pickler = cPickle.Pickler(output, cPickle.HIGHEST_PROTOCOL)
+    pickler.fast = 1
+    pickler.dump(canonicalize(serialized))
+    return output.getvalue()
+
+
+def diff_serialized(first, second, key_path=''):
+    if isinstance(first, dict) and isinstance(second, dict):
+        differences = []
+        for key in sorted(set(first) | set(second)):
+            child_path = '%s/%s' % (key_path, key)
+            if key not in first or key not in second:
+                differences.append('%s: only in %s' % (child_path, 'second' if key not in first else 'first'))
+            else:
+                differences.extend(diff_serialized(first[key], second[key], child_path))
+        return differences
+
+    if isinstance(first, (list, tuple)) and isinstance(second, (list, tuple)) and len(first) == len(second):
+        differences = []
+        for index, (first_value, second_value) in enumerate(zip(first, second)):
+            differences.extend(diff_serialized(first_value, second_value, '%s[%d]' % (key_path, index)))
+        return differences
+
+    return [] if first == second else ['%s: %r != %r' % (key_path or '/', first, second)]
+
+
+def _read(manifest_path):
+    manifest_file = open(manifest_path, 'rb')
+    try:
+        return manifest_file.read()
+    finally:
+        manifest_file.close()
+
+
+def _file_md5(abs_path):
+    if not os.path.exists(abs_path):
+        return None
+
+    opened_file = open(abs_path, 'rb')
+    try:
+        return hashlib.md5(opened_file.read()).hexdigest()
+    finally:
+        opened_file.close()
+
+
+def _referenced_paths(serialized_manifest):
+    paths = set()
+    for content_type_manifest in serialized_manifest.get('manifest', {}).itervalues():
+        for serialized_module in content_type_manifest.itervalues():
+            for serialized_ver in [serialized_module] + list(serialized_module.get('prev_versions') or []):
+                if serialized_ver.get('path'):
+                    paths.add(serialized_ver['path'])
+                    paths.add(serialized_ver['path'] + '.map')
+    return sorted(paths)
+
+
+def compare_builds(first_manifest_path, first_root, second_manifest_path, second_root):
+    # the manifests must be byte for byte identical, and so must every file they reference
+    first_bytes, second_bytes = _read(first_manifest_path), _read(second_manifest_path)
+    first, second = cPickle.loads(first_bytes), cPickle.loads(second_bytes)
+
+    differences = []
+    if first_bytes != second_bytes:
+        differences.append('manifest: bytes %s != %s' % (
+            hashlib.md5(first_bytes).hexdigest(), hashlib.md5(second_bytes).hexdigest()))
+        # what differs in the contents, if anything, rather than in how they were pickled
+        differences.extend(diff_serialized(first, second))
+
+    for path in sorted(set(_referenced_paths(first)) | set(_referenced_paths(second))):
+        first_md5 = _file_md5(os.path.normpath(first_root + os.sep + path))
+        second_md5 = _file_md5(os.path.normpath(second_root + os.sep + path))
+        if first_md5 != second_md5:
+            differences.append('%s: content %s != %s' % (path, first_md5, second_md5))
+
+    return differences
+
+
+def main(argv=None):
+    # imported here, the manifest imports this module and never parses arguments
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Verify two builds of the same commit, e.g. from two workers, are byte for byte identical.')
+    parser.add_argument('first_manifest')
+    parser.add_argument('first_root', help='app root the first manifest\'s paths are relative to')
+    parser.add_argument('second_manifest')
+    parser.add_argument('second_root', help='app root the second manifest\'s paths are relative to')
+    args = parser.parse_args(argv)
+
+    differences = compare_builds(args.first_manifest, args.first_root, args.second_manifest, args.second_root)
+    for difference in differences:
+        sys.stdout.write(difference + '\n')
+    return 1 if differences else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
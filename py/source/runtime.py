@@ -1,16 +1,17 @@
+import threading
+
 from .env import BaseEnv
 from .env import DefaultEnv
-from .manifest import Manifest
 
 
 class Runtime(object):
     _runtime_instance = None
+    _lock = threading.Lock()
 
     def __init__(self, env=None):
         super(Runtime, self).__init__()
         self._env_instance = env if isinstance(env, BaseEnv) else DefaultEnv()
-        if self._env_instance:
-            Manifest.load()
+        # the manifest is loaded on first use, see Manifest.get_content_type_manifest
 
     @property
     def env(self):
@@ -20,9 +21,14 @@ class Runtime(object):
     def has_started(self):
         return bool(self._runtime_instance)
 
+    @property
+    def manifest(self):
+        from .manifest import Manifest
+        return Manifest.load()
+
     @classmethod
     def get(cls):
-        if not cls._runtime_instance.has_started:
+        if cls._runtime_instance is None or not cls._runtime_instance.has_started:
             raise RuntimeError('the paste runtime has not been started')
 
         return cls._runtime_instance
@@ -30,6 +36,17 @@ class Runtime(object):
     @classmethod
     def start(cls, env=None):
         if cls._runtime_instance is None:
-            cls._runtime_instance = cls(env)
+            with cls._lock:
+                if cls._runtime_instance is None:
+                    cls._runtime_instance = cls(env)
+
+        return cls._runtime_instance
+
+
+class RuntimeEnv(object):
+    # stands in for the started runtime's env, so modules can import it before Runtime.start is called
+    def __getattr__(self, name):
+        return getattr(Runtime.get().env, name)
+
 
-        return cls._runtime_instance
\ No newline at end of file
+env = RuntimeEnv()
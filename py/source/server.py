@@ -0,0 +1,295 @@
+import os
+import re
+
+import logging
+
+log = logging.getLogger('paste')
+
+from ..util import content_type_helper
+
+from .runtime import env
+
+from . import content as paste_content, manifest as paste_manifest, module as paste_module, \
+    sourcemap as paste_sourcemap
+
+FAR_FUTURE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+BUNDLE_SEPARATOR = '\n'
+
+_MIME_TYPES = {
+    '.js': 'application/javascript; charset=utf-8',
+    '.css': 'text/css; charset=utf-8',
+    '.scss': 'text/css; charset=utf-8',
+    paste_sourcemap.MAP_EXTENSION: 'application/json; charset=utf-8'
+}
+
+_RANGE_EXPR = re.compile(r'^bytes=(?P<start>\d*)-(?P<end>\d*)$')
+
+
+def _mime_type(path):
+    extension = os.path.splitext(path)[1]
+    if extension in _MIME_TYPES:
+        return _MIME_TYPES[extension]
+
+    # mimetypes imports urllib and with it ssl, it is only needed for extensions paste doesn't prime
+    import mimetypes
+    return mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+
+class Route(object):
+    # everything needed to answer a request for one url, computed once when the route table is built
+    def __init__(self, abs_paths, checksum, mime_type, versioned, source_map_url=None, reader=None):
+        super(Route, self).__init__()
+        self.abs_paths = abs_paths
+        self.checksum = checksum
+        self.mime_type = mime_type
+        self.versioned = versioned
+        self.source_map_url = source_map_url
+        # contents produced on request instead of streamed from disk: compile mode reads through the primer,
+        # which compiles scss on read, and the index maps of bundles
+        self.reader = reader
+
+    @property
+    def etag(self):
+        return '"%s"' % self.checksum if self.checksum else None
+
+    @property
+    def is_bundle(self):
+        return len(self.abs_paths) > 1
+
+
+class AssetApplication(object):
+    # wsgi app serving primed files, their source maps and bundles under env.root_uri
+    def __init__(self, content_types=None, block_size=64 * 1024):
+        super(AssetApplication, self).__init__()
+        self.content_types = content_types or [content_type_helper.JAVASCRIPT, content_type_helper.SCSS,
+                                               content_type_helper.CSS]
+        self.block_size = block_size
+        # content type -> (snapshot, routes), each built on the first request for one of its urls
+        self._routes = {}
+
+    @classmethod
+    def _url(cls, path):
+        return paste_module.Module.path_to_url(path)
+
+    def _content_type(self, url):
+        if url.endswith(paste_sourcemap.MAP_EXTENSION):
+            url = url[:-len(paste_sourcemap.MAP_EXTENSION)]
+        content_type = content_type_helper.filename_to_content_type(url)
+        return content_type if content_type in self.content_types else None
+
+    def _add_file_routes(self, routes, content_type_manifest, versioned):
+        primer = content_type_manifest.primer
+        for module_name, module in content_type_manifest.manifest.iteritems():
+            reader = None
+            if env.compile_mode and module.path:
+                reader = lambda path=module.path: primer.read_primed(path)
+
+            if module.path:
+                source_map_url = self._url(module.source_map_path) if module.source_map_path else None
+                routes[self._url(module.path)] = Route(
+                    [module.abs_path], module.checksum, _mime_type(module.source_path), versioned,
+                    source_map_url=source_map_url, reader=reader
+                )
+                if source_map_url:
+                    routes[source_map_url] = Route(
+                        [module.abs_source_map_path], module.checksum + paste_sourcemap.MAP_EXTENSION,
+                        _mime_type(module.source_map_path), versioned
+                    )
+
+            # previous versions keep being served for pages that still reference them
+            for serialized_ver in module.serialized_versions:
+                path = serialized_ver.get('path')
+                abs_path = os.path.normpath(os.path.normpath(env.app_root) + os.sep + path) if path else None
+                if abs_path and os.path.exists(abs_path) and self._url(path) not in routes:
+                    routes[self._url(path)] = Route(
+                        [abs_path], serialized_ver.get('checksum'), _mime_type(module.source_path), versioned
+                    )
+
+    def _add_bundle_routes(self, routes, content_type_manifest):
+        if env.compile_mode:
+            return
+
+        for module_name in content_type_manifest.manifest:
+            members = [content_type_manifest.manifest[member] for member in
+                       content_type_manifest.bundle_members(module_name)]
+            if len(members) < 2 or not all(member.path for member in members):
+                continue
+            bundle_url = content_type_manifest.bundle_url(module_name)
+            checksum = content_type_manifest.bundle_etag([member.name for member in members]).strip('"')
+
+            source_map_url = None
+            if any(member.source_map_path for member in members):
+                source_map_url = paste_sourcemap.map_path(bundle_url)
+                routes[source_map_url] = Route(
+                    [member.abs_path for member in members]
+                    + [member.abs_source_map_path for member in members if member.source_map_path],
+                    checksum + paste_sourcemap.MAP_EXTENSION, _mime_type(source_map_url), True,
+                    reader=self._bundle_map_reader(content_type_manifest, [member.name for member in members],
+                                                   bundle_url.rsplit('/', 1)[-1])
+                )
+            routes[bundle_url] = Route(
+                [member.abs_path for member in members], checksum, _mime_type(members[-1].source_path), True,
+                source_map_url=source_map_url
+            )
+
+    @classmethod
+    def _bundle_map_reader(cls, content_type_manifest, module_names, file_name):
+        # the index map is composed on the first request for it, the route is rebuilt with the next snapshot
+        composed = []
+
+        def reader():
+            if not composed:
+                composed.append(paste_sourcemap.dumps_map(content_type_manifest.bundle_source_map(
+                    module_names, file_name=file_name, separator=BUNDLE_SEPARATOR)))
+            return composed[0]
+        return reader
+
+    def routes(self, content_type=None):
+        # a url's extension names its content type, so a request only builds (in compile mode) and routes that one.
+        # rebuilt only when the manifest publishes a new snapshot, a request is a single dict lookup otherwise
+        if content_type is None:
+            routes = {}
+            for content_type in self.content_types:
+                routes.update(self.routes(content_type))
+            return routes
+
+        snapshot = paste_manifest.Manifest.get_content_type_manifest(content_type)
+        cached = self._routes.get(content_type.type)
+        if cached is None or cached[0] is not snapshot:
+            routes = {}
+            self._add_file_routes(routes, snapshot, env.versioning and not env.compile_mode)
+            self._add_bundle_routes(routes, snapshot)
+            cached = self._routes[content_type.type] = (snapshot, routes)
+        return cached[1]
+
+    @classmethod
+    def _etag_matches(cls, header, etag):
+        if not header or not etag:
+            return False
+        candidates = [candidate.strip() for candidate in header.split(',')]
+        return '*' in candidates or etag in candidates or ('W/' + etag) in candidates
+
+    @classmethod
+    def _parse_range(cls, header, size):
+        # (start, end) inclusive, None to serve the whole file, False when unsatisfiable.
+        # multiple ranges are answered with the whole file, which the spec allows
+        match = _RANGE_EXPR.match((header or '').strip())
+        if not match:
+            return None
+
+        start, end = match.group('start'), match.group('end')
+        if not start and not end:
+            return None
+        if not start:
+            suffix_length = int(end)
+            if not suffix_length:
+                return False
+            return max(0, size - suffix_length), size - 1
+
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+        if start >= size or start > end:
+            return False
+        return start, end
+
+    def _iter_range(self, opened_file, start, end):
+        try:
+            opened_file.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = opened_file.read(min(self.block_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            opened_file.close()
+
+    def _iter_bundle(self, abs_paths):
+        for index, abs_path in enumerate(abs_paths):
+            if index:
+                yield BUNDLE_SEPARATOR
+            opened_file = paste_content.open_primed(abs_path)
+            try:
+                while True:
+                    chunk = opened_file.read(self.block_size)
+                    if not chunk:
+                        break
+                    yield chunk
+            finally:
+                opened_file.close()
+
+    def __call__(self, environ, start_response):
+        method = environ.get('REQUEST_METHOD', 'GET')
+        if method not in ('GET', 'HEAD'):
+            start_response('405 Method Not Allowed', [('Allow', 'GET, HEAD'), ('Content-Length', '0')])
+            return []
+
+        url = environ.get('SCRIPT_NAME', '') + environ.get('PATH_INFO', '')
+        content_type = self._content_type(url)
+        route = self.routes(content_type).get(url) if content_type is not None else None
+        if route is None or not all(os.path.exists(abs_path) for abs_path in route.abs_paths):
+            start_response('404 Not Found', [('Content-Type', 'text/plain'), ('Content-Length', '9')])
+            return ['Not Found'] if method == 'GET' else []
+
+        headers = [
+            ('Cache-Control', FAR_FUTURE_CACHE_CONTROL if route.versioned else REVALIDATE_CACHE_CONTROL),
+            ('Content-Type', route.mime_type)
+        ]
+        if route.etag:
+            headers.append(('ETag', route.etag))
+        if route.source_map_url:
+            headers.append(('SourceMap', route.source_map_url))
+
+        if self._etag_matches(environ.get('HTTP_IF_NONE_MATCH'), route.etag):
+            start_response('304 Not Modified', headers)
+            return []
+
+        if route.reader is not None:
+            contents = route.reader()
+            start_response('200 OK', headers + [('Content-Length', str(len(contents)))])
+            return [contents] if method == 'GET' else []
+
+        if route.is_bundle:
+            size = sum(os.path.getsize(abs_path) for abs_path in route.abs_paths) \
+                + len(BUNDLE_SEPARATOR) * (len(route.abs_paths) - 1)
+            start_response('200 OK', headers + [('Accept-Ranges', 'none'), ('Content-Length', str(size))])
+            return self._iter_bundle(route.abs_paths) if method == 'GET' else []
+
+        opened_file = paste_content.open_primed(route.abs_paths[0])
+        size = os.fstat(opened_file.fileno()).st_size
+        headers.append(('Accept-Ranges', 'bytes'))
+
+        byte_range = None
+        if environ.get('HTTP_RANGE') and (not environ.get('HTTP_IF_RANGE')
+                                          or environ.get('HTTP_IF_RANGE').strip() == route.etag):
+            byte_range = self._parse_range(environ.get('HTTP_RANGE'), size)
+
+        if byte_range is False:
+            opened_file.close()
+            start_response('416 Requested Range Not Satisfiable',
+                           headers + [('Content-Range', 'bytes */%d' % size), ('Content-Length', '0')])
+            return []
+
+        if byte_range is not None:
+            start, end = byte_range
+            start_response('206 Partial Content', headers + [
+                ('Content-Range', 'bytes %d-%d/%d' % (start, end, size)),
+                ('Content-Length', str(end - start + 1))
+            ])
+            if method == 'HEAD':
+                opened_file.close()
+                return []
+            return self._iter_range(opened_file, start, end)
+
+        start_response('200 OK', headers + [('Content-Length', str(size))])
+        if method == 'HEAD':
+            opened_file.close()
+            return []
+
+        # lets the server use sendfile where it can
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        if file_wrapper is not None:
+            return file_wrapper(opened_file, self.block_size)
+        return self._iter_range(opened_file, 0, size - 1)
@@ -0,0 +1,114 @@
+import json
+import os
+import tempfile
+import traceback
+
+import logging
+
+log = logging.getLogger('paste')
+
+MAP_EXTENSION = '.map'
+
+
+def map_path(path):
+    # maps live next to the primed file, so they share its checksum keyed name
+    return path + MAP_EXTENSION if path else None
+
+
+def read_map(abs_map_path):
+    if not abs_map_path or not os.path.exists(abs_map_path):
+        return None
+
+    map_file = open(abs_map_path, 'rb')
+    try:
+        return json.loads(map_file.read())
+    except ValueError, e:
+        log.warning('Could not parse source map %s. e=%s' % (abs_map_path, traceback.format_exc()))
+        return None
+    finally:
+        map_file.close()
+
+
+def dumps_map(source_map):
+    return json.dumps(source_map, sort_keys=True, separators=(',', ':'))
+
+
+def write_map(abs_path, source_map):
+    map_file = open(map_path(abs_path), 'wb')
+    try:
+        map_file.write(dumps_map(source_map))
+    finally:
+        map_file.close()
+
+
+def _real_source(entry, root):
+    # the path to keep for a map entry naming a real file, None for compiler inputs and pseudo names like stdin
+    if not entry or not root:
+        return None
+
+    root = os.path.normpath(root)
+    abs_entry = os.path.normpath(os.path.join(root, entry))
+    if not os.path.isfile(abs_entry):
+        return None
+    if abs_entry.startswith(root + os.sep):
+        return os.path.relpath(abs_entry, root).replace(os.sep, '/')
+    if abs_entry.startswith(os.path.normpath(tempfile.gettempdir()) + os.sep):
+        return None
+    return abs_entry.replace(os.sep, '/')
+
+
+def normalize_map(source_map, source_path, file_name, root=None):
+    # the compressor only sees the module under a temporary name, point that entry back at the real source.
+    # entries for real files, e.g. scss partials imported from the load paths, are kept, relative to root
+    source_map = dict(source_map)
+    source_map['version'] = 3
+    source_map['file'] = file_name
+    source_map['sources'] = [_real_source(entry, root) or source_path.replace(os.sep, '/')
+                             for entry in source_map.get('sources') or [None]]
+    source_map.pop('sourceRoot', None)
+    return source_map
+
+
+def _advance(line, column, contents):
+    newlines = contents.count('\n')
+    if newlines:
+        return line + newlines, len(contents) - contents.rfind('\n') - 1
+    return line, column + len(contents)
+
+
+def compose_index_map(file_name, sections, separator='\n'):
+    # sections are (contents, source_map) pairs in bundle order, source_map may be None
+    line, column = 0, 0
+    index_sections = []
+    for index, (contents, source_map) in enumerate(sections):
+        if index:
+            line, column = _advance(line, column, separator)
+        if source_map:
+            index_sections.append({'offset': {'line': line, 'column': column}, 'map': source_map})
+        line, column = _advance(line, column, contents or '')
+
+    return {'version': 3, 'file': file_name, 'sections': index_sections}
+
+
+class TemporaryMap(object):
+    # a path for the compressor to write a map to during the single compression pass
+    def __init__(self, enabled=True):
+        super(TemporaryMap, self).__init__()
+        self.enabled = enabled
+        self.path = None
+        self.source_map = None
+
+    def __enter__(self):
+        if self.enabled:
+            file_descriptor, self.path = tempfile.mkstemp(prefix='paste-map-', suffix=MAP_EXTENSION)
+            os.close(file_descriptor)
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        if self.path:
+            try:
+                if exc_type is None and os.path.getsize(self.path):
+                    self.source_map = read_map(self.path)
+            finally:
+                os.remove(self.path)
+        return False
@@ -0,0 +1,202 @@
+import abc
+import os
+import tempfile
+import threading
+import traceback
+
+import logging
+
+log = logging.getLogger('paste')
+
+
+def _urllib2():
+    # urllib2 pulls in httplib and ssl, which only the http store needs
+    import urllib2
+    return urllib2
+
+
+def artifact_key(module, path=None):
+    # primed files are content addressed, so the checksum plus the extension identifies an artifact
+    path = path or module.path
+    if not module.checksum or not path:
+        return None
+    return module.checksum + os.path.splitext(path)[1]
+
+
+def _write_atomic(abs_path, chunks):
+    directory = os.path.dirname(abs_path)
+    if not os.path.exists(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            if not os.path.isdir(directory):
+                raise
+
+    file_descriptor, tmp_path = tempfile.mkstemp(dir=directory, prefix='.paste-artifact-')
+    try:
+        tmp_file = os.fdopen(file_descriptor, 'wb')
+        try:
+            for chunk in chunks:
+                tmp_file.write(chunk)
+        finally:
+            tmp_file.close()
+        os.rename(tmp_path, abs_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _iter_file(opened_file, chunk_size=64 * 1024):
+    while True:
+        chunk = opened_file.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+class ArtifactStore(object):
+    __metaclass__ = abc.ABCMeta
+
+    class StoreException(Exception):
+        pass
+
+    def __init__(self, concurrency=4):
+        super(ArtifactStore, self).__init__()
+        self.concurrency = max(1, concurrency)
+
+    @abc.abstractmethod
+    def has(self, key):
+        raise NotImplementedError('')
+
+    @abc.abstractmethod
+    def put(self, key, abs_path):
+        raise NotImplementedError('')
+
+    @abc.abstractmethod
+    def fetch(self, key, abs_path):
+        raise NotImplementedError('')
+
+    def _run(self, func, items):
+        # runs func over (key, abs_path) items with at most self.concurrency in flight, returns the failed items
+        items = list(items)
+        failures = []
+        lock = threading.Lock()
+
+        def worker():
+            while True:
+                with lock:
+                    if not items:
+                        return
+                    key, abs_path = items.pop()
+                try:
+                    func(key, abs_path)
+                except Exception, e:
+                    log.error('Artifact failure key=%s; path=%s; e=%s' % (key, abs_path, traceback.format_exc()))
+                    with lock:
+                        failures.append((key, abs_path))
+
+        threads = [threading.Thread(target=worker) for _ in range(min(self.concurrency, len(items)))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return failures
+
+    def put_many(self, items):
+        def put_missing(key, abs_path):
+            if not self.has(key):
+                self.put(key, abs_path)
+
+        return self._run(put_missing, items)
+
+    def fetch_many(self, items, optional=False):
+        # optional artifacts, e.g. source maps that were never written, are skipped rather than failed when missing
+        def fetch(key, abs_path):
+            if not optional or self.has(key):
+                self.fetch(key, abs_path)
+
+        return self._run(fetch, items)
+
+
+class LocalArtifactStore(ArtifactStore):
+    def __init__(self, root, concurrency=4):
+        super(LocalArtifactStore, self).__init__(concurrency=concurrency)
+        self.root = root
+
+    def _key_path(self, key):
+        return os.path.normpath(os.path.join(self.root, key[:2], key))
+
+    def has(self, key):
+        return os.path.exists(self._key_path(key))
+
+    def put(self, key, abs_path):
+        source_file = open(abs_path, 'rb')
+        try:
+            _write_atomic(self._key_path(key), _iter_file(source_file))
+        finally:
+            source_file.close()
+
+    def fetch(self, key, abs_path):
+        if not self.has(key):
+            raise self.StoreException('Missing artifact key=%s' % key)
+
+        stored_file = open(self._key_path(key), 'rb')
+        try:
+            _write_atomic(abs_path, _iter_file(stored_file))
+        finally:
+            stored_file.close()
+
+
+class HttpArtifactStore(ArtifactStore):
+    # works against any server that maps GET/HEAD/PUT on <base_url>/<key> to an object, e.g. an s3 style bucket
+    def __init__(self, base_url, concurrency=8, timeout=30, headers=None):
+        super(HttpArtifactStore, self).__init__(concurrency=concurrency)
+        self.base_url = base_url.rstrip('/') + '/'
+        self.timeout = timeout
+        self.headers = headers or {}
+
+    def _request(self, method, key, data=None):
+        urllib2 = _urllib2()
+        request = urllib2.Request(self.base_url + key, data=data, headers=self.headers)
+        request.get_method = lambda: method
+        return urllib2.urlopen(request, timeout=self.timeout)
+
+    def has(self, key):
+        urllib2 = _urllib2()
+        try:
+            self._request('HEAD', key).close()
+        except urllib2.HTTPError, e:
+            if e.code == 404:
+                return False
+            raise self.StoreException(e)
+        except urllib2.URLError, e:
+            raise self.StoreException(e)
+        return True
+
+    def put(self, key, abs_path):
+        urllib2 = _urllib2()
+        source_file = open(abs_path, 'rb')
+        try:
+            contents = source_file.read()
+        finally:
+            source_file.close()
+
+        try:
+            self._request('PUT', key, data=contents).close()
+        except urllib2.URLError, e:
+            raise self.StoreException(e)
+
+    def fetch(self, key, abs_path):
+        urllib2 = _urllib2()
+        try:
+            response = self._request('GET', key)
+        except urllib2.URLError, e:
+            raise self.StoreException(e)
+
+        try:
+            _write_atomic(abs_path, _iter_file(response))
+        finally:
+            response.close()
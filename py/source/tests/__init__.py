@@ -0,0 +1,148 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from ...util import content_type_helper
+
+from .. import content as paste_content, manifest as paste_manifest, primer as paste_primer, runtime as paste_runtime
+from ..env import DefaultEnv
+
+
+class TestEnv(DefaultEnv):
+    # a DefaultEnv rooted in a temporary app root, any setting can be overridden per test
+    def __init__(self, app_root, **settings):
+        super(TestEnv, self).__init__()
+        self.settings = dict({
+            'app_root': app_root,
+            'build_area': app_root,
+            'content_type_paths': (
+                (content_type_helper.JAVASCRIPT, os.path.join(app_root, 'js')),
+                (content_type_helper.SCSS, os.path.join(app_root, 'css'))
+            ),
+            'internal_lib_paths': (),
+            'excluded_dirs': ()
+        }, **settings)
+
+    def __getattribute__(self, name):
+        settings = object.__getattribute__(self, 'settings')
+        if name in settings:
+            return settings[name]
+        return object.__getattribute__(self, name)
+
+
+class StubCompressor(object):
+    # stands in for paste.service.compressor: output is the whitespace collapsed source, so it is deterministic,
+    # and closure's --chunk and --create_source_map flags are honoured
+    def __init__(self):
+        super(StubCompressor, self).__init__()
+        self.calls = []
+        # code closure injects into the first chunk, e.g. $jscomp polyfills and transpilation helpers
+        self.runtime = ''
+
+    @classmethod
+    def _minify(cls, contents):
+        return ' '.join(contents.split())
+
+    @classmethod
+    def _write_map(cls, map_path, sources):
+        map_file = open(map_path, 'wb')
+        try:
+            map_file.write(json.dumps({'version': 3, 'sources': sources, 'names': [], 'mappings': 'AAAA'}))
+        finally:
+            map_file.close()
+
+    def compress(self, source, kind, *args, **kwargs):
+        self.calls.append((kind, args, kwargs))
+        flags = [tuple(arg.split(' ', 1)) if ' ' in arg else (arg, None) for arg in args]
+        chunk_prefix = dict(flags).get('--chunk_output_path_prefix')
+        map_path = dict(flags).get('--create_source_map') or kwargs.get('source_map_path')
+
+        if chunk_prefix is None:
+            if map_path:
+                self._write_map(map_path, ['stdin'])
+            return self._minify(source)
+
+        # closure assigns the --js inputs, in order, to the chunks in the order they are declared
+        inputs = []
+        runtime = self.runtime
+        for flag, value in flags:
+            if flag == '--js':
+                inputs.append(value)
+            elif flag == '--chunk':
+                chunk_name, input_count = value.split(':')[:2]
+                chunk_inputs, inputs = inputs[:int(input_count)], inputs[int(input_count):]
+                output_path = chunk_prefix + chunk_name + '.js'
+                output_file = open(output_path, 'wb')
+                try:
+                    contents = ''.join(open(path, 'rb').read() for path in chunk_inputs)
+                    output_file.write(runtime + self._minify(contents))
+                    runtime = ''
+                finally:
+                    output_file.close()
+                if map_path:
+                    self._write_map(map_path.replace('%outname%', chunk_name + '.js'), chunk_inputs)
+        return ''
+
+    def chunk_calls(self):
+        return [args for kind, args, kwargs in self.calls if any(arg.startswith('--chunk ') for arg in args)]
+
+
+class PasteTestCase(unittest.TestCase):
+    env_settings = {}
+
+    def setUp(self):
+        super(PasteTestCase, self).setUp()
+        self.app_root = os.path.realpath(tempfile.mkdtemp(prefix='paste-test-'))
+        os.makedirs(os.path.join(self.app_root, 'js'))
+        os.makedirs(os.path.join(self.app_root, 'css'))
+
+        self.env = TestEnv(self.app_root, **self.env_settings)
+        self.compressor = StubCompressor()
+
+        self._runtime_instance = paste_runtime.Runtime._runtime_instance
+        self._compressor = paste_primer._compressor
+        paste_runtime.Runtime._runtime_instance = paste_runtime.Runtime(self.env)
+        paste_primer._compressor = lambda: self.compressor
+        paste_manifest.Manifest._instance = None
+        paste_content._cache = None
+
+    def tearDown(self):
+        paste_runtime.Runtime._runtime_instance = self._runtime_instance
+        paste_primer._compressor = self._compressor
+        paste_manifest.Manifest._instance = None
+        paste_content._cache = None
+        shutil.rmtree(self.app_root, ignore_errors=True)
+        super(PasteTestCase, self).tearDown()
+
+    def write(self, path, contents):
+        abs_path = os.path.join(self.app_root, path)
+        if not os.path.exists(os.path.dirname(abs_path)):
+            os.makedirs(os.path.dirname(abs_path))
+        source_file = open(abs_path, 'wb')
+        try:
+            source_file.write(contents)
+        finally:
+            source_file.close()
+        return abs_path
+
+    def write_js(self, path, module_name, body, requires=(), compilation_level=None):
+        header = ['/**', ' * @module %s' % module_name]
+        header += [' * @requires %s' % dependency for dependency in requires]
+        if compilation_level:
+            header.append(' * @compilation_level %s' % compilation_level)
+        return self.write(os.path.join('js', path), '\n'.join(header + [' */', body, '']))
+
+    def build_dir_files(self, path='js'):
+        build_dir = os.path.join(self.app_root, path, self.env.build_prefix)
+        return sorted(os.listdir(build_dir)) if os.path.exists(build_dir) else []
+
+    @classmethod
+    def md5(cls, abs_path):
+        opened_file = open(abs_path, 'rb')
+        try:
+            return hashlib.md5(opened_file.read()).hexdigest()
+        finally:
+            opened_file.close()
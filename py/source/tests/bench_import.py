@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# times a cold import in fresh interpreters and lists the heavy modules it pulled in, e.g.
+#   python -m paste.source.tests.bench_import [-n 20] [paste.source.manifest]
+import json
+import os
+import subprocess
+import sys
+
+# modules a plain import of the manifest must not load, they belong to the code paths that need them
+HEAVY_MODULES = ('argparse', 'httplib', 'paste.service.compressor', 'ssl', 'urllib2')
+
+_IMPORT_SCRIPT = '''
+import json, sys, time
+start = time.time()
+import %s
+elapsed = time.time() - start
+sys.stdout.write(json.dumps({'seconds': elapsed, 'modules': sorted(sys.modules)}))
+'''
+
+
+def import_stats(module_name):
+    # a new interpreter every time, anything already imported by the caller would hide the cost
+    environ = dict(os.environ, PYTHONPATH=os.pathsep.join(path for path in sys.path if path))
+    output = subprocess.Popen([sys.executable, '-c', _IMPORT_SCRIPT % module_name],
+                              stdout=subprocess.PIPE, env=environ).communicate()[0]
+    stats = json.loads(output)
+    return stats['seconds'], stats['modules']
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Time a cold import of a paste module.')
+    parser.add_argument('module', nargs='?', default='paste.source.manifest')
+    parser.add_argument('-n', '--runs', type=int, default=10)
+    args = parser.parse_args(argv)
+
+    timings = []
+    for _ in range(args.runs):
+        seconds, modules = import_stats(args.module)
+        timings.append(seconds)
+    timings.sort()
+
+    sys.stdout.write('%s: min %.1fms, median %.1fms over %d runs, %d modules loaded\n' % (
+        args.module, timings[0] * 1000, timings[len(timings) // 2] * 1000, args.runs, len(modules)))
+    heavy_modules = [module_name for module_name in HEAVY_MODULES if module_name in modules]
+    if heavy_modules:
+        sys.stdout.write('heavy modules loaded: %s\n' % ', '.join(heavy_modules))
+    return 1 if heavy_modules else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
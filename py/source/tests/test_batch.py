@@ -0,0 +1,130 @@
+import os
+
+from ...util import content_type_helper
+
+from . import PasteTestCase
+from .. import sourcemap as paste_sourcemap
+from ..manifest import Manifest
+
+ADVANCED = 'ADVANCED_OPTIMIZATIONS'
+
+
+class BatchCompilationTest(PasteTestCase):
+    env_settings = {'batch_compilation': True}
+
+    def setUp(self):
+        super(BatchCompilationTest, self).setUp()
+        self.write_js('lib.js', 'lib', 'var lib = 1;')
+        self.write_js('core.js', 'core', 'var core = 2;', compilation_level=ADVANCED)
+        self.write_js('widget.js', 'widget', 'var widget = core + lib;', requires=['core', 'lib'],
+                      compilation_level=ADVANCED)
+        self.write_js('page.js', 'page', 'var page = widget;', requires=['widget'], compilation_level=ADVANCED)
+
+    def _chunk_flags(self, args):
+        # flag values with the invocation's temporary directory stripped
+        flags = []
+        for arg in args:
+            flag, value = arg.split(' ', 1)
+            if flag in ('--js', '--externs', '--chunk_output_path_prefix'):
+                value = os.path.basename(value.rstrip(os.sep))
+            flags.append((flag, value))
+        return flags
+
+    def _assert_primed(self, manifest, module_name, version):
+        module = manifest.get_manifest(content_type_helper.JAVASCRIPT)[module_name]
+        self.assertEqual(module.version, version)
+        self.assertTrue(os.path.exists(module.abs_path))
+        self.assertEqual(self.md5(module.abs_path), module.checksum)
+        self.assertTrue(('.v%s.min.js' % version) in module.path)
+        self.assertEqual(module.contents, self.compressor._minify(module.source_contents))
+        return module
+
+    def test_level_is_compiled_in_one_invocation(self):
+        manifest = Manifest()
+        manifest.build()
+
+        chunk_calls = self.compressor.chunk_calls()
+        self.assertEqual(len(chunk_calls), 1)
+        flags = self._chunk_flags(chunk_calls[0])
+        self.assertEqual(flags[0], ('--compilation_level', ADVANCED))
+        self.assertEqual(flags[2:], [
+            ('--js', 'paste_root.src.js'), ('--chunk', 'paste_root:1'),
+            ('--js', 'core_0.src.js'), ('--chunk', 'core_0:1:paste_root'),
+            ('--js', 'widget_1.src.js'), ('--chunk', 'widget_1:1:core_0'),
+            ('--js', 'page_2.src.js'), ('--chunk', 'page_2:1:core_0,widget_1'),
+            # lib is compiled on its own at another level, so its symbols must not be renamed
+            ('--externs', 'lib_0.externs.js')
+        ])
+        # lib is the only module compiled outside the invocation
+        self.assertEqual(len(self.compressor.calls), 2)
+
+        for module_name in ('core', 'widget', 'page', 'lib'):
+            self._assert_primed(manifest, module_name, 1.0)
+        sorted_deps = manifest.get_sorted_deps(content_type_helper.JAVASCRIPT)
+        self.assertEqual([module_name for module_name, _, _ in sorted_deps], ['core', 'lib', 'widget', 'page'])
+
+    def test_change_recompiles_the_whole_level(self):
+        manifest = Manifest()
+        manifest.build()
+        unchanged = dict((module_name, manifest.get_manifest(content_type_helper.JAVASCRIPT)[module_name].path)
+                         for module_name in ('core', 'widget', 'lib'))
+        self.compressor.calls = []
+
+        self.write_js('page.js', 'page', 'var page = widget + 1;', requires=['widget'], compilation_level=ADVANCED)
+        manifest.build()
+
+        chunk_calls = self.compressor.chunk_calls()
+        self.assertEqual(len(chunk_calls), 1)
+        self.assertEqual([value for flag, value in self._chunk_flags(chunk_calls[0]) if flag == '--js'],
+                         ['paste_root.src.js', 'core_0.src.js', 'widget_1.src.js', 'page_2.src.js'])
+        # lib didn't change and isn't part of the level
+        self.assertEqual(len(self.compressor.calls), 1)
+
+        page = self._assert_primed(manifest, 'page', 2.0)
+        self.assertEqual(len(page.serialized_versions), 1)
+        for module_name, path in unchanged.iteritems():
+            module = self._assert_primed(manifest, module_name, 1.0)
+            self.assertEqual(module.path, path)
+            self.assertEqual(module.serialized_versions, [])
+
+    def test_extern_change_recompiles_the_level(self):
+        manifest = Manifest()
+        manifest.build()
+        self.compressor.calls = []
+
+        self.write_js('lib.js', 'lib', 'var lib = 3;')
+        manifest.build()
+
+        self.assertEqual(len(self.compressor.chunk_calls()), 1)
+        self.assertEqual(len(self.compressor.calls), 2)
+        self._assert_primed(manifest, 'lib', 2.0)
+        self._assert_primed(manifest, 'widget', 1.0)
+
+    def test_unrelated_change_leaves_the_level_alone(self):
+        self.write_js('other.js', 'other', 'var other = 1;')
+        manifest = Manifest()
+        manifest.build()
+        self.compressor.calls = []
+
+        self.write_js('other.js', 'other', 'var other = 2;')
+        manifest.build()
+
+        self.assertEqual(self.compressor.chunk_calls(), [])
+        self.assertEqual(len(self.compressor.calls), 1)
+        self._assert_primed(manifest, 'other', 2.0)
+
+    def test_root_chunk_output_is_prepended(self):
+        self.env.settings['source_maps'] = True
+        self.compressor.runtime = 'var $jscomp = $jscomp || {};'
+        manifest = Manifest()
+        manifest.build()
+
+        for module_name in ('core', 'widget', 'page'):
+            module = manifest.get_manifest(content_type_helper.JAVASCRIPT)[module_name]
+            self.assertEqual(module.contents,
+                             'var $jscomp = $jscomp || {};\n' + self.compressor._minify(module.source_contents))
+            source_map = paste_sourcemap.read_map(module.abs_source_map_path)
+            self.assertEqual(source_map['mappings'], ';AAAA')
+        # compiled on its own, outside the chunked invocation
+        lib = manifest.get_manifest(content_type_helper.JAVASCRIPT)['lib']
+        self.assertEqual(lib.contents, self.compressor._minify(lib.source_contents))
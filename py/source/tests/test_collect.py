@@ -0,0 +1,88 @@
+import os
+import time
+
+from ...util import content_type_helper
+
+from . import PasteTestCase
+from ..manifest import Manifest
+
+
+class CollectTest(PasteTestCase):
+    def _build(self, manifest, body):
+        self.write_js('app.js', 'app', body)
+        manifest.build()
+        return manifest.get_manifest(content_type_helper.JAVASCRIPT)['app']
+
+    def test_keep_versions_removes_every_older_file(self):
+        manifest = Manifest()
+        for index in range(4):
+            module = self._build(manifest, 'var app = %d;' % index)
+        self.assertEqual(module.version, 4.0)
+        self.assertEqual(len(module.serialized_versions), 3)
+        self.assertEqual(len(self.build_dir_files()), 4)
+
+        report = manifest.collect(keep_versions=1)
+        self.assertEqual(report.trimmed_versions, 2)
+        self.assertEqual(len(report.removed_paths), 2)
+        self.assertEqual([ver['version'] for ver in module.serialized_versions], [3.0])
+        self.assertEqual(self.build_dir_files(), sorted(
+            os.path.basename(path) for path in [module.path, module.serialized_versions[0]['path']]))
+
+    def test_dry_run_changes_nothing(self):
+        manifest = Manifest()
+        self._build(manifest, 'var app = 1;')
+        module = self._build(manifest, 'var app = 2;')
+        files = self.build_dir_files()
+
+        report = manifest.collect(keep_versions=0, dry_run=True)
+        self.assertTrue(report.dry_run)
+        self.assertEqual(len(report.removed_paths), 1)
+        self.assertTrue(report.reclaimed_bytes > 0)
+        self.assertEqual(self.build_dir_files(), files)
+        self.assertEqual(len(module.serialized_versions), 1)
+        self.assertEqual(manifest._gc_pending, {('js', 'app')})
+
+    def test_only_replaced_modules_are_pending(self):
+        manifest = Manifest()
+        self._build(manifest, 'var app = 1;')
+        self.assertEqual(manifest._gc_pending, set())
+
+        self._build(manifest, 'var app = 2;')
+        self.assertEqual(manifest._gc_pending, {('js', 'app')})
+
+        manifest.collect(keep_versions=1)
+        self.assertEqual(manifest._gc_pending, set())
+
+        # the module still has a previous version, but nothing was replaced
+        module = self._build(manifest, 'var app = 2;')
+        self.assertEqual(len(module.serialized_versions), 1)
+        self.assertEqual(manifest._gc_pending, set())
+
+    def test_max_age_counts_from_replacement(self):
+        manifest = Manifest()
+        first = self._build(manifest, 'var app = 1;')
+        # written long ago, but only replaced now
+        long_ago = time.time() - 30 * 24 * 60 * 60
+        os.utime(first.abs_path, (long_ago, long_ago))
+        module = self._build(manifest, 'var app = 2;')
+
+        now = time.time()
+        self.assertEqual(module.expired_versions(max_age=60 * 60, now=now), [])
+        self.assertEqual(module.expired_versions(max_age=60 * 60, now=now + 2 * 60 * 60),
+                         module.serialized_versions)
+
+        self.assertEqual(manifest.collect(max_age=60 * 60).trimmed_versions, 0)
+        self.assertTrue(os.path.exists(first.abs_path))
+        # still pending, it expires on a later pass
+        self.assertEqual(manifest._gc_pending, {('js', 'app')})
+
+    def test_max_age_without_replaced_at_uses_successor(self):
+        manifest = Manifest()
+        self._build(manifest, 'var app = 1;')
+        module = self._build(manifest, 'var app = 2;')
+        module.serialized_versions[0].pop('replaced_at')
+
+        replaced_at = time.time() - 2 * 60 * 60
+        os.utime(module.abs_path, (replaced_at, replaced_at))
+        self.assertEqual(module.expired_versions(max_age=60 * 60), module.serialized_versions)
+        self.assertEqual(module.expired_versions(max_age=3 * 60 * 60), [])
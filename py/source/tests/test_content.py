@@ -0,0 +1,98 @@
+import os
+
+from . import PasteTestCase
+from .. import content as paste_content
+from ..content import PrimedContentCache
+
+
+class PrimedContentCacheTest(PasteTestCase):
+    env_settings = {'content_cache_size': 64, 'content_cache_entry_size': 16}
+
+    def setUp(self):
+        super(PrimedContentCacheTest, self).setUp()
+        self.reads = []
+        self._read = paste_content._read
+        paste_content._read = lambda abs_path: self.reads.append(abs_path) or self._read(abs_path)
+
+    def tearDown(self):
+        paste_content._read = self._read
+        super(PrimedContentCacheTest, self).tearDown()
+
+    def test_least_recently_used_are_evicted_by_total_bytes(self):
+        cache = PrimedContentCache(10, 10)
+        cache.put('a', 'aaaa')
+        cache.put('b', 'bbbb')
+        self.assertEqual(cache.get('a'), 'aaaa')
+        cache.put('c', 'cccc')
+
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual((cache.get('a'), cache.get('c')), ('aaaa', 'cccc'))
+        self.assertEqual(cache.byte_size, 8)
+
+        # replacing an entry accounts for the old size
+        cache.put('a', 'aa')
+        self.assertEqual(cache.byte_size, 6)
+        cache.clear()
+        self.assertEqual((cache.byte_size, cache.get('a')), (0, None))
+
+    def test_entry_size_cutoff(self):
+        cache = PrimedContentCache(64, 4)
+        self.assertTrue(cache.cacheable(4))
+        self.assertFalse(cache.cacheable(5))
+        cache.put('large', 'x' * 5)
+        self.assertEqual((cache.get('large'), cache.byte_size), (None, 0))
+
+        small = self.write('small.js', 'x' * 16)
+        large = self.write('large.js', 'x' * 17)
+        for _ in range(2):
+            self.assertEqual(paste_content.read_primed(small), 'x' * 16)
+            self.assertEqual(paste_content.read_primed(large), 'x' * 17)
+        # only the file under the entry size is served from the cache
+        self.assertEqual(self.reads, [small, large, large])
+        self.assertEqual(paste_content.get_cache().byte_size, 16)
+
+    def test_rewritten_file_gets_a_new_key(self):
+        abs_path = self.write('app.js', 'var a = 1;')
+        os.utime(abs_path, (1000000000, 1000000000))
+        self.assertEqual(paste_content.read_primed(abs_path), 'var a = 1;')
+
+        # same size, new mtime
+        self.write('app.js', 'var a = 2;')
+        os.utime(abs_path, (1000000001, 1000000001))
+        self.assertEqual(paste_content.read_primed(abs_path), 'var a = 2;')
+
+        # same mtime, new size
+        self.write('app.js', 'var a = 10;')
+        os.utime(abs_path, (1000000001, 1000000001))
+        self.assertEqual(paste_content.read_primed(abs_path), 'var a = 10;')
+        self.assertEqual(len(self.reads), 3)
+
+    def test_large_files_are_memory_mapped(self):
+        abs_path = self.write('large.js', 'x' * 17)
+        mapped = []
+        map_primed = paste_content.map_primed
+        paste_content.map_primed = lambda path: mapped.append(path) or map_primed(path)
+        try:
+            view = paste_content.view_primed(abs_path)
+        finally:
+            paste_content.map_primed = map_primed
+
+        self.assertEqual(mapped, [abs_path])
+        self.assertEqual(str(view), 'x' * 17)
+        self.assertEqual((self.reads, paste_content.get_cache().byte_size), ([], 0))
+        # the mapping outlives the file's descriptor, and the file itself
+        os.remove(abs_path)
+        self.assertEqual(view[:3], 'xxx')
+
+    def test_small_files_are_viewed_from_the_cache(self):
+        abs_path = self.write('small.js', 'var s = 1;')
+        self.assertEqual(str(paste_content.view_primed(abs_path)), 'var s = 1;')
+        self.assertEqual(str(paste_content.view_primed(abs_path)), 'var s = 1;')
+        self.assertEqual(self.reads, [abs_path])
+
+    def test_empty_files(self):
+        abs_path = self.write('empty.js', '')
+        self.assertEqual(paste_content.map_primed(abs_path), buffer(''))
+        self.assertEqual(str(paste_content.view_primed(abs_path)), '')
+        self.assertEqual(paste_content.read_primed(abs_path), '')
+        self.assertEqual(paste_content.read_primed(os.path.join(self.app_root, 'missing.js')), '')
@@ -0,0 +1,90 @@
+import __builtin__
+import os
+
+from ...util import content_type_helper
+
+from . import PasteTestCase
+from ..manifest import Manifest
+
+
+class FingerprintTest(PasteTestCase):
+    def setUp(self):
+        super(FingerprintTest, self).setUp()
+        self.write_js('base.js', 'base', 'var base = 1;')
+        self.write_js('app.js', 'app', 'var app = base;', requires=['base'])
+        self.write('css/site.scss', '@module "site";\nbody { color: red; }\n')
+
+    def _fingerprints(self, manifest):
+        return (manifest.fingerprint, manifest.get_fingerprint(content_type_helper.JAVASCRIPT),
+                manifest.get_fingerprint(content_type_helper.SCSS))
+
+    def _load(self):
+        Manifest._instance = None
+        return Manifest.load()
+
+    def test_stable_across_save_and_load(self):
+        manifest = Manifest()
+        manifest.build()
+        manifest.save()
+        built = self._fingerprints(manifest)
+
+        self.assertEqual(self._fingerprints(self._load()), built)
+        # computed again from the loaded modules, e.g. for a manifest saved without them
+        manifest = self._load()
+        manifest._fingerprints = {}
+        self.assertEqual(self._fingerprints(manifest), built)
+
+        manifest.build()
+        self.assertEqual(self._fingerprints(manifest), built)
+
+    def test_changed_checksum_changes_the_fingerprint(self):
+        manifest = Manifest()
+        manifest.build()
+        fingerprint, js_fingerprint, scss_fingerprint = self._fingerprints(manifest)
+        Manifest._instance = manifest
+        snapshot = Manifest.get_content_type_manifest(content_type_helper.JAVASCRIPT)
+        etags = (snapshot.etag, snapshot.bundle_etag(['base', 'app']), snapshot.bundle_etag(['base']))
+
+        self.write_js('app.js', 'app', 'var app = base + 1;', requires=['base'])
+        manifest.build()
+        self.assertNotEqual(manifest.fingerprint, fingerprint)
+        self.assertNotEqual(manifest.get_fingerprint(content_type_helper.JAVASCRIPT), js_fingerprint)
+        self.assertEqual(manifest.get_fingerprint(content_type_helper.SCSS), scss_fingerprint)
+
+        snapshot = Manifest.get_content_type_manifest(content_type_helper.JAVASCRIPT)
+        self.assertNotEqual(snapshot.etag, etags[0])
+        self.assertNotEqual(snapshot.bundle_etag(['base', 'app']), etags[1])
+        self.assertEqual(snapshot.bundle_etag(['base']), etags[2])
+
+    def test_no_file_system_access(self):
+        manifest = Manifest()
+        manifest.build()
+        Manifest._instance = manifest
+        snapshot = Manifest.get_content_type_manifest(content_type_helper.JAVASCRIPT)
+        manifest._fingerprints = {}
+
+        def forbidden(*args, **kwargs):
+            raise AssertionError('file system accessed: %r' % (args,))
+
+        patched = [(os, 'stat'), (os.path, 'exists'), (os.path, 'getmtime'), (__builtin__, 'open')]
+        originals = [getattr(owner, name) for owner, name in patched]
+        for owner, name in patched:
+            setattr(owner, name, forbidden)
+        try:
+            self._fingerprints(manifest)
+            snapshot.etag
+            snapshot.bundle_etag(['base', 'app'])
+        finally:
+            for (owner, name), original in zip(patched, originals):
+                setattr(owner, name, original)
+
+    def test_content_type_fingerprint_leaves_the_others_serialized(self):
+        manifest = Manifest()
+        manifest.build()
+        manifest.save()
+
+        manifest = self._load()
+        manifest._fingerprints = {}
+        manifest.get_fingerprint(content_type_helper.JAVASCRIPT)
+        self.assertTrue('scss' in manifest._serialized_manifest)
+        self.assertFalse('js' in manifest._serialized_manifest)
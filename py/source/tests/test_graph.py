@@ -0,0 +1,130 @@
+import cPickle
+import os
+import StringIO
+import sys
+import unittest
+
+from ...util import content_type_helper
+
+from . import PasteTestCase
+from .. import graph as paste_graph
+from ..graph import DependencyIndex
+from ..manifest import Manifest
+
+
+class DependencyIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = DependencyIndex(forward={
+            'app': ['widget', 'lib'],
+            'widget': ['core'],
+            'core': [],
+            'lib': [],
+            'lonely': [],
+            'broken': ['gone']
+        })
+
+    def test_dependencies(self):
+        self.assertEqual(self.index.dependencies('app'), ['lib', 'widget'])
+        self.assertEqual(self.index.dependencies('app', transitive=True), ['core', 'lib', 'widget'])
+        self.assertEqual(self.index.dependencies('core', transitive=True), [])
+        self.assertEqual(self.index.dependencies('unknown'), [])
+
+    def test_dependents(self):
+        self.assertEqual(self.index.dependents('core'), ['widget'])
+        self.assertEqual(self.index.dependents('core', transitive=True), ['app', 'widget'])
+        self.assertEqual(self.index.dependents('app', transitive=True), [])
+
+    def test_affected(self):
+        self.assertEqual(self.index.affected(['core']), ['app', 'core', 'widget'])
+        self.assertEqual(self.index.affected(['lib', 'lonely']), ['app', 'lib', 'lonely'])
+        self.assertEqual(self.index.affected([]), [])
+
+    def test_path(self):
+        self.assertEqual(self.index.path('app', 'core'), ['app', 'widget', 'core'])
+        self.assertEqual(self.index.path('app', 'app'), ['app'])
+        self.assertEqual(self.index.path('core', 'app'), None)
+
+    def test_orphans_and_missing(self):
+        self.assertEqual(self.index.orphans(), ['lonely'])
+        self.assertEqual(self.index.missing(), ['gone'])
+
+    def test_round_trip(self):
+        index = DependencyIndex.deserialize(self.index.serialize())
+        self.assertEqual(index.forward, self.index.forward)
+        self.assertEqual(index.reverse, self.index.reverse)
+
+
+class ManifestIndexTest(PasteTestCase):
+    def setUp(self):
+        super(ManifestIndexTest, self).setUp()
+        self.write_js('core.js', 'core', 'var core = 1;')
+        self.write_js('widget.js', 'widget', 'var widget = core;', requires=['core'])
+        self.write_js('app.js', 'app', 'var app = widget;', requires=['widget'])
+
+    def _build(self):
+        manifest = Manifest()
+        manifest.build()
+        manifest.save()
+        return manifest
+
+    def _main(self, *argv):
+        stdout = sys.stdout
+        sys.stdout = StringIO.StringIO()
+        try:
+            status = paste_graph.main(list(argv))
+            return status, sys.stdout.getvalue().split()
+        finally:
+            sys.stdout = stdout
+
+    def test_index_holds_the_direct_edges(self):
+        manifest = self._build()
+        index = manifest.get_dependency_index(content_type_helper.JAVASCRIPT)
+        # the modules themselves hold the backfilled, transitive dependencies
+        self.assertEqual(sorted(manifest.get_manifest(content_type_helper.JAVASCRIPT)['app'].dependencies),
+                         ['core', 'widget'])
+        self.assertEqual(index.dependencies('app'), ['widget'])
+
+        Manifest._instance = None
+        index = Manifest.load().get_dependency_index(content_type_helper.JAVASCRIPT)
+        self.assertEqual(index.dependencies('app'), ['widget'])
+        self.assertEqual(index.dependents('core', transitive=True), ['app', 'widget'])
+
+    def test_manifest_without_an_index(self):
+        manifest = self._build()
+        serialized = manifest.serialize()
+        del serialized['graph']
+
+        index = Manifest.deserialize(serialized).get_dependency_index(content_type_helper.JAVASCRIPT)
+        self.assertEqual(index.dependencies('app'), ['core', 'widget'])
+        self.assertEqual(index.dependents('core'), ['app', 'widget'])
+
+    def test_main_reads_only_the_index(self):
+        build_path = self._build()._build_path()
+        self.assertTrue(os.path.exists(paste_graph.index_path(build_path)))
+        # the manifest itself is never unpickled
+        open(build_path, 'wb').write('not a pickle')
+
+        self.assertEqual(self._main(build_path, 'js', 'dependents', 'core'), (0, ['widget']))
+        self.assertEqual(self._main(build_path, 'js', 'dependents', 'core', '-t'), (0, ['app', 'widget']))
+        self.assertEqual(self._main(build_path, 'js', 'dependencies', 'app'), (0, ['widget']))
+        self.assertEqual(self._main(build_path, 'js', 'path', 'app', 'core'), (0, ['app', 'widget', 'core']))
+        self.assertEqual(self._main(build_path, 'js', 'affected', 'widget'), (0, ['app', 'widget']))
+        self.assertEqual(self._main(build_path, 'js', 'orphans'), (0, []))
+        self.assertEqual(self._main(build_path, 'js', 'path', 'core', 'app'), (1, []))
+
+    def test_main_falls_back_to_the_manifest(self):
+        manifest = self._build()
+        build_path = manifest._build_path()
+        os.remove(paste_graph.index_path(build_path))
+
+        self.assertEqual(self._main(build_path, 'js', 'dependencies', 'app', '-t'), (0, ['core', 'widget']))
+        # older manifests without any index
+        serialized = manifest.serialize()
+        del serialized['graph']
+        open(build_path, 'wb').write(cPickle.dumps(serialized, cPickle.HIGHEST_PROTOCOL))
+        stderr = sys.stderr
+        sys.stderr = StringIO.StringIO()
+        try:
+            self.assertRaises(SystemExit, self._main, build_path, 'js', 'orphans')
+        finally:
+            sys.stderr = stderr
@@ -0,0 +1,13 @@
+import unittest
+
+from .bench_import import HEAVY_MODULES, import_stats
+
+
+class ImportTest(unittest.TestCase):
+    def test_manifest_import_is_light(self):
+        seconds, modules = import_stats('paste.source.manifest')
+        self.assertEqual([module_name for module_name in HEAVY_MODULES if module_name in modules], [])
+
+    def test_server_import_is_light(self):
+        seconds, modules = import_stats('paste.source.server')
+        self.assertEqual([module_name for module_name in HEAVY_MODULES if module_name in modules], [])
@@ -0,0 +1,36 @@
+from ...util import content_type_helper
+
+from . import PasteTestCase
+from ..manifest import Manifest
+from ..primer import PrimerHelper
+
+
+class InlineEscapeTest(PasteTestCase):
+    def test_javascript(self):
+        escape_inline = PrimerHelper.JAVASCRIPT.escape_inline
+        self.assertEqual(escape_inline('var a = "</script>";'), 'var a = "<\\/script>";')
+        self.assertEqual(escape_inline("var a = '</SCRIPT >' + /<\\/script/;"),
+                         "var a = '<\\/SCRIPT >' + /<\\/script/;")
+        # unescaped, the html tokenizer would treat the element's own '</script>' as part of the script
+        self.assertEqual(escape_inline('var a = "<!-- <script>";'), 'var a = "<\\!-- <script>";')
+        self.assertEqual(escape_inline('var a = /<!--/i;'), 'var a = /<\\!--/i;')
+
+    def test_scss(self):
+        escape_inline = PrimerHelper.SCSS.escape_inline
+        self.assertEqual(escape_inline('a:after { content: "</style>"; }'), 'a:after { content: "<\\/style>"; }')
+        self.assertEqual(escape_inline('a:after { content: "</STYLE"; }'), 'a:after { content: "<\\/STYLE"; }')
+
+    def test_small_modules_are_inlined_escaped(self):
+        self.env.settings['network_request_threshold'] = 64
+        self.write_js('small.js', 'small', 'var s = "</script>";')
+        self.write_js('large.js', 'large', 'var l = "%s";' % ('x' * 64))
+
+        manifest = Manifest()
+        manifest.build()
+        Manifest._instance = manifest
+        assets = Manifest.get_content_type_manifest(content_type_helper.JAVASCRIPT).resolve_assets(['small', 'large'])
+
+        self.assertEqual(assets[0][:2], ('small', 'inline'))
+        self.assertTrue(assets[0][2].endswith('var s = "<\\/script>";'))
+        self.assertEqual(assets[1][:2], ('large', 'url'))
+        self.assertTrue(assets[1][2].endswith('.min.js'))
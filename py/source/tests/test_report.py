@@ -0,0 +1,72 @@
+from ...util import content_type_helper
+
+from . import PasteTestCase
+from .. import content as paste_content, report as paste_report
+from ..manifest import Manifest
+from ..report import BuildReport
+
+
+class ReportTest(PasteTestCase):
+    env_settings = {'content_cache_entry_size': 0}
+
+    def setUp(self):
+        super(ReportTest, self).setUp()
+        self.write_js('base.js', 'base', 'var base = 1;')
+        self.write_js('app.js', 'app', 'var app = base;', requires=['base'])
+        self.write_js('admin.js', 'admin', 'var admin = base;', requires=['base'])
+
+    def test_large_modules_are_read_once(self):
+        manifest = Manifest()
+        manifest.build()
+
+        reads = []
+        _read = paste_content._read
+        paste_content._read = lambda abs_path: reads.append(abs_path) or _read(abs_path)
+        try:
+            report = BuildReport.from_manifest(manifest, ['js'])
+        finally:
+            paste_content._read = _read
+
+        self.assertEqual(sorted(report.entries['js']), ['admin', 'app'])
+        self.assertEqual(len(reads), 3)
+        self.assertEqual(len(set(reads)), 3)
+
+    def test_growth_is_measured_against_the_saved_report(self):
+        manifest = Manifest()
+        manifest.build()
+        manifest.save()
+
+        manifest = Manifest.load()
+        self.write_js('app.js', 'app', 'var app = base; ' + 'var grown = 1; ' * 50, requires=['base'])
+        manifest.build(content_types=[content_type_helper.JAVASCRIPT])
+        budgets = {'app': {'raw_growth': 0.05}}
+        self.assertEqual(len(manifest.check_budgets(budgets)), 1)
+
+        # a later build of another content type doesn't move the baseline
+        manifest.build(content_types=[content_type_helper.SCSS])
+        self.assertEqual(len(manifest.check_budgets(budgets)), 1)
+        manifest.build(content_types=[content_type_helper.JAVASCRIPT])
+        self.assertEqual(len(manifest.check_budgets(budgets)), 1)
+        self.assertRaises(BuildReport.BudgetException, manifest.enforce_budgets, budgets)
+
+    def test_unchanged_payloads_are_not_measured_again(self):
+        manifest = Manifest()
+        manifest.build()
+        first_report = manifest.report
+
+        measured = []
+        _gzip_size = paste_report._gzip_size
+        paste_report._gzip_size = lambda contents: measured.append(contents) or _gzip_size(contents)
+        try:
+            manifest.build()
+            self.assertEqual(measured, [])
+            self.assertEqual(manifest.report.entries, first_report.entries)
+
+            self.write_js('admin.js', 'admin', 'var admin = base + 1;', requires=['base'])
+            manifest.build()
+        finally:
+            paste_report._gzip_size = _gzip_size
+
+        self.assertEqual(len(measured), 1)
+        self.assertEqual(manifest.report.entries['js']['app'], first_report.entries['js']['app'])
+        self.assertNotEqual(manifest.report.entries['js']['admin'], first_report.entries['js']['admin'])
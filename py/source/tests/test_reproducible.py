@@ -0,0 +1,83 @@
+import cPickle
+import os
+import shutil
+import tempfile
+
+from . import PasteTestCase, TestEnv
+from .. import reproducible as paste_reproducible, runtime as paste_runtime
+from ..manifest import Manifest
+
+
+class ReproducibleTest(PasteTestCase):
+    env_settings = {'reproducible_builds': True}
+
+    def setUp(self):
+        super(ReproducibleTest, self).setUp()
+        self.write_js('base.js', 'base', 'var base = 1;')
+        self.write_js('app.js', 'app', 'var app = base;', requires=['base'])
+        self.write('css/site.scss', '@module "site";\nbody { color: red; }\n')
+
+    def _build(self):
+        manifest = Manifest()
+        manifest.build()
+        manifest.save()
+        return manifest._build_path()
+
+    def _read(self, path):
+        opened_file = open(path, 'rb')
+        try:
+            return opened_file.read()
+        finally:
+            opened_file.close()
+
+    def test_object_sharing_does_not_change_the_bytes(self):
+        dependencies = ['base']
+        shared = {'app': {'dependencies': dependencies}, 'page': {'dependencies': dependencies}}
+        distinct = {'app': {'dependencies': ['base']}, 'page': {'dependencies': ['base']}}
+        self.assertNotEqual(cPickle.dumps(shared, cPickle.HIGHEST_PROTOCOL),
+                            cPickle.dumps(distinct, cPickle.HIGHEST_PROTOCOL))
+        self.assertEqual(paste_reproducible.dumps(shared), paste_reproducible.dumps(distinct))
+
+    def test_saving_again_is_byte_identical(self):
+        manifest = Manifest()
+        manifest.build()
+        manifest.save()
+        first = self._read(manifest._build_path())
+
+        manifest.build()
+        manifest.save()
+        self.assertEqual(self._read(manifest._build_path()), first)
+
+        Manifest.load().save()
+        self.assertEqual(self._read(manifest._build_path()), first)
+
+    def test_builds_in_two_roots_compare_equal(self):
+        first_path = self._build()
+        first_copy = os.path.join(tempfile.mkdtemp(prefix='paste-test-'), 'first.pkl')
+        shutil.copy(first_path, first_copy)
+
+        second_root = os.path.realpath(tempfile.mkdtemp(prefix='paste-test-'))
+        try:
+            for path in ('js', 'css'):
+                shutil.copytree(os.path.join(self.app_root, path), os.path.join(second_root, path),
+                                ignore=shutil.ignore_patterns(self.env.build_prefix))
+            paste_runtime.Runtime._runtime_instance = paste_runtime.Runtime(
+                TestEnv(second_root, **self.env_settings))
+            Manifest._instance = None
+            second_path = self._build()
+
+            self.assertEqual(
+                paste_reproducible.compare_builds(first_copy, self.app_root, second_path, second_root), [])
+
+            # equal contents pickled with the memo still differ
+            manifest_file = open(second_path, 'wb')
+            try:
+                manifest_file.write(cPickle.dumps(cPickle.loads(self._read(first_copy)), cPickle.HIGHEST_PROTOCOL))
+            finally:
+                manifest_file.close()
+            differences = paste_reproducible.compare_builds(first_copy, self.app_root, second_path, second_root)
+            self.assertEqual(len(differences), 1)
+            self.assertTrue(differences[0].startswith('manifest: bytes '))
+        finally:
+            shutil.rmtree(os.path.dirname(first_copy), ignore_errors=True)
+            shutil.rmtree(second_root, ignore_errors=True)
@@ -0,0 +1,161 @@
+import json
+import os
+import shutil
+import tempfile
+
+from ...util import content_type_helper
+
+from . import PasteTestCase
+from ..manifest import Manifest
+from ..server import AssetApplication, FAR_FUTURE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL
+
+
+class ServerTest(PasteTestCase):
+    def setUp(self):
+        super(ServerTest, self).setUp()
+        self.write_js('base.js', 'base', 'var base = 1;')
+        self.write_js('app.js', 'app', 'var app = base;', requires=['base'])
+        self.write('css/site.scss', '@module "site";\nbody { color: red; }\n')
+        self.app = AssetApplication()
+
+    def _request(self, url, method='GET', **environ):
+        response = {}
+
+        def start_response(status, headers):
+            response['status'], response['headers'] = status, dict(headers)
+
+        environ.update({'REQUEST_METHOD': method, 'PATH_INFO': url})
+        body = ''.join(self.app(environ, start_response))
+        return response['status'], response['headers'], body
+
+    def _get(self, url):
+        status, headers, body = self._request(url)
+        return status, body
+
+    def _module(self, module_name):
+        snapshot = Manifest.get_content_type_manifest(content_type_helper.JAVASCRIPT)
+        return snapshot.manifest[module_name], snapshot.url(module_name)
+
+    def test_build_area_outside_the_app_root(self):
+        build_area = os.path.realpath(tempfile.mkdtemp(prefix='paste-test-'))
+        self.env.settings['build_area'] = build_area
+        try:
+            snapshot = Manifest.get_content_type_manifest(content_type_helper.JAVASCRIPT)
+            module = snapshot.manifest['app']
+            self.assertTrue(module.path.startswith(os.pardir))
+
+            url = snapshot.url('app')
+            self.assertEqual(url, '/paste/js/%s/%s' % (self.env.build_prefix, os.path.basename(module.path)))
+            routes = self.app.routes(content_type_helper.JAVASCRIPT)
+            self.assertEqual(sorted(url for url in routes if not url.startswith('/paste/_bundle/')),
+                             sorted(snapshot.url(module_name) for module_name in ('app', 'base')))
+            self.assertFalse(any('..' in url for url in routes))
+            self.assertEqual(self._get(url), ('200 OK', module.contents))
+        finally:
+            shutil.rmtree(build_area, ignore_errors=True)
+
+    def test_request_builds_only_its_content_type(self):
+        self.env.settings['compile_mode'] = True
+        builds = []
+        _build = Manifest.build
+
+        def counting_build(manifest, content_types=None, **options):
+            builds.append(tuple(sorted(content_type.type for content_type in content_types or [])))
+            return _build(manifest, content_types=content_types, **options)
+
+        Manifest.build = counting_build
+        try:
+            self.assertEqual(self._get('/paste/js/missing.js')[0], '404 Not Found')
+            self.assertEqual(builds, [('js',)])
+
+            url = Manifest.get_content_type_manifest(content_type_helper.JAVASCRIPT).url('app')
+            self.assertEqual(self._get(url)[0], '200 OK')
+            self.assertEqual(self._get('/paste/robots.txt')[0], '404 Not Found')
+            self.assertEqual(builds, [('js',)])
+        finally:
+            Manifest.build = _build
+
+    def test_conditional_requests(self):
+        module, url = self._module('app')
+        status, headers, body = self._request(url)
+        etag = headers['ETag']
+        self.assertEqual((status, etag, body), ('200 OK', '"%s"' % module.checksum, module.contents))
+
+        for if_none_match in (etag, 'W/' + etag, '"other", ' + etag, '*'):
+            self.assertEqual(self._request(url, HTTP_IF_NONE_MATCH=if_none_match)[::2], ('304 Not Modified', ''))
+        self.assertEqual(self._request(url, HTTP_IF_NONE_MATCH='"other"')[0], '200 OK')
+
+    def test_ranges(self):
+        module, url = self._module('app')
+        contents, size = module.contents, len(module.contents)
+
+        status, headers, body = self._request(url, HTTP_RANGE='bytes=0-3')
+        self.assertEqual((status, body), ('206 Partial Content', contents[:4]))
+        self.assertEqual((headers['Content-Range'], headers['Content-Length']), ('bytes 0-3/%d' % size, '4'))
+
+        status, headers, body = self._request(url, HTTP_RANGE='bytes=-3')
+        self.assertEqual((status, body), ('206 Partial Content', contents[-3:]))
+        self.assertEqual(headers['Content-Range'], 'bytes %d-%d/%d' % (size - 3, size - 1, size))
+        self.assertEqual(self._request(url, HTTP_RANGE='bytes=4-')[2], contents[4:])
+
+        status, headers, body = self._request(url, HTTP_RANGE='bytes=%d-' % size)
+        self.assertEqual((status, headers['Content-Range'], body),
+                         ('416 Requested Range Not Satisfiable', 'bytes */%d' % size, ''))
+
+        # a stale If-Range gets the whole, current file
+        status, headers, body = self._request(url, HTTP_RANGE='bytes=0-3', HTTP_IF_RANGE='"stale"')
+        self.assertEqual((status, body), ('200 OK', contents))
+        etag = '"%s"' % module.checksum
+        self.assertEqual(self._request(url, HTTP_RANGE='bytes=0-3', HTTP_IF_RANGE=etag)[0], '206 Partial Content')
+
+    def test_head_has_no_body(self):
+        module, url = self._module('app')
+        status, headers, body = self._request(url, method='HEAD')
+        self.assertEqual((status, headers['Content-Length'], body), ('200 OK', str(len(module.contents)), ''))
+        self.assertEqual(self._request(url, method='HEAD', HTTP_RANGE='bytes=0-3')[::2], ('206 Partial Content', ''))
+        self.assertEqual(self._request(url, method='POST')[0], '405 Method Not Allowed')
+
+    def test_cache_control(self):
+        module, url = self._module('app')
+        self.assertEqual(self._request(url)[1]['Cache-Control'], FAR_FUTURE_CACHE_CONTROL)
+
+        self.env.settings['versioning'] = False
+        self.app = AssetApplication()
+        self.assertEqual(self._request(url)[1]['Cache-Control'], REVALIDATE_CACHE_CONTROL)
+
+    def test_file_wrapper(self):
+        module, url = self._module('app')
+        wrapped = []
+
+        def file_wrapper(opened_file, block_size):
+            wrapped.append((opened_file.name, block_size))
+            try:
+                return [opened_file.read()]
+            finally:
+                opened_file.close()
+
+        status, headers, body = self._request(url, **{'wsgi.file_wrapper': file_wrapper})
+        self.assertEqual((status, body), ('200 OK', module.contents))
+        self.assertEqual(wrapped, [(module.abs_path, self.app.block_size)])
+
+    def test_bundle_source_map(self):
+        self.env.settings['source_maps'] = True
+        snapshot = Manifest.get_content_type_manifest(content_type_helper.JAVASCRIPT)
+        bundle_url = snapshot.bundle_url('app')
+
+        status, headers, body = self._request(bundle_url)
+        base, app = snapshot.manifest['base'], snapshot.manifest['app']
+        self.assertEqual((status, body), ('200 OK', base.contents + '\n' + app.contents))
+        self.assertEqual(headers['SourceMap'], bundle_url + '.map')
+
+        status, headers, body = self._request(bundle_url + '.map')
+        self.assertEqual((status, headers['Cache-Control']), ('200 OK', FAR_FUTURE_CACHE_CONTROL))
+        self.assertEqual(headers['Content-Length'], str(len(body)))
+        index_map = json.loads(body)
+        self.assertEqual(index_map['file'], 'app.js')
+        self.assertEqual([(section['offset'], section['map']['sources']) for section in index_map['sections']], [
+            ({'line': 0, 'column': 0}, [base.source_path]),
+            ({'line': 1, 'column': 0}, [app.source_path])
+        ])
+        self.assertEqual(self._request(bundle_url + '.map', HTTP_IF_NONE_MATCH=headers['ETag'])[0],
+                         '304 Not Modified')
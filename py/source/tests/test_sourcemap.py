@@ -0,0 +1,52 @@
+import os
+import tempfile
+
+from ...util import content_type_helper
+
+from . import PasteTestCase
+from .. import sourcemap as paste_sourcemap
+from ..manifest import Manifest
+
+
+class SourceMapTest(PasteTestCase):
+    env_settings = {'source_maps': True}
+
+    def test_compiler_input_points_at_the_source(self):
+        compiler_input = os.path.join(tempfile.gettempdir(), 'paste-compile-input.scss')
+        source_map = paste_sourcemap.normalize_map(
+            {'version': 3, 'sources': [compiler_input, 'stdin'], 'sourceRoot': '/tmp', 'mappings': 'AAAA'},
+            os.path.join('css', 'site.scss'), 'site.min.scss', root=self.app_root
+        )
+        self.assertEqual(source_map['sources'], ['css/site.scss', 'css/site.scss'])
+        self.assertEqual(source_map['file'], 'site.min.scss')
+        self.assertFalse('sourceRoot' in source_map)
+
+    def test_imported_partials_are_kept(self):
+        partial = self.write(os.path.join('css', 'partials', '_colors.scss'), '$red: #f00;')
+        library_dir = tempfile.mkdtemp(dir=os.path.expanduser('~'), prefix='.paste-test-')
+        library_partial = os.path.join(library_dir, '_grid.scss')
+        open(library_partial, 'w').close()
+        try:
+            source_map = paste_sourcemap.normalize_map(
+                {'version': 3, 'sources': ['stdin', partial, library_partial], 'mappings': 'AAAA'},
+                os.path.join('css', 'site.scss'), 'site.min.scss', root=self.app_root
+            )
+        finally:
+            os.remove(library_partial)
+            os.rmdir(library_dir)
+
+        self.assertEqual(source_map['sources'], ['css/site.scss', 'css/partials/_colors.scss', library_partial])
+
+    def test_chunk_maps_point_at_module_sources(self):
+        self.env.settings['batch_compilation'] = True
+        self.write_js('core.js', 'core', 'var core = 1;', compilation_level='ADVANCED_OPTIMIZATIONS')
+        self.write_js('page.js', 'page', 'var page = core;', requires=['core'],
+                      compilation_level='ADVANCED_OPTIMIZATIONS')
+        manifest = Manifest()
+        manifest.build()
+
+        for module_name in ('core', 'page'):
+            module = manifest.get_manifest(content_type_helper.JAVASCRIPT)[module_name]
+            source_map = paste_sourcemap.read_map(module.abs_source_map_path)
+            self.assertEqual(source_map['sources'], [module.source_path])
+            self.assertEqual(source_map['file'], os.path.basename(module.path))
@@ -0,0 +1,139 @@
+import BaseHTTPServer
+import os
+import shutil
+import threading
+
+from ...util import content_type_helper
+
+from . import PasteTestCase
+from .. import store as paste_store
+from ..manifest import Manifest
+
+
+class _ObjectHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    # GET/HEAD/PUT on /<key>, like an s3 style bucket. server.failures makes the next requests fail with a 500
+    def log_message(self, *args):
+        pass
+
+    def _fail(self):
+        with self.server.lock:
+            if self.server.failures:
+                self.server.failures -= 1
+                self.send_response(500)
+                self.end_headers()
+                return True
+        return False
+
+    def do_HEAD(self):
+        if self._fail():
+            return
+        self.send_response(200 if self.path in self.server.objects else 404)
+        self.end_headers()
+
+    def do_GET(self):
+        if self._fail():
+            return
+        if self.path not in self.server.objects:
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(self.server.objects[self.path])))
+        self.end_headers()
+        self.wfile.write(self.server.objects[self.path])
+
+    def do_PUT(self):
+        if self._fail():
+            return
+        self.server.objects[self.path] = self.rfile.read(int(self.headers['Content-Length']))
+        self.send_response(201)
+        self.end_headers()
+
+
+class StoreTest(PasteTestCase):
+    def setUp(self):
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), _ObjectHandler)
+        self.server.objects = {}
+        self.server.failures = 0
+        self.server.lock = threading.Lock()
+        server_thread = threading.Thread(target=self.server.serve_forever)
+        server_thread.daemon = True
+        server_thread.start()
+
+        self.store = paste_store.HttpArtifactStore('http://127.0.0.1:%d/artifacts' % self.server.server_port,
+                                                   concurrency=2)
+        self.env_settings = {'artifact_store': self.store, 'source_maps': True}
+        super(StoreTest, self).setUp()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        super(StoreTest, self).tearDown()
+
+    def test_put_and_fetch(self):
+        abs_path = self.write('artifact.js', 'var a = 1;')
+        self.assertEqual(self.store.put_many([('abc.js', abs_path)]), [])
+        self.assertTrue(self.store.has('abc.js'))
+        self.assertFalse(self.store.has('missing.js'))
+
+        fetched_path = os.path.join(self.app_root, 'fetched', 'abc.js')
+        self.assertEqual(self.store.fetch_many([('abc.js', fetched_path)]), [])
+        self.assertEqual(open(fetched_path).read(), 'var a = 1;')
+
+        missing_path = os.path.join(self.app_root, 'fetched', 'missing.js')
+        self.assertEqual(self.store.fetch_many([('missing.js', missing_path)]), [('missing.js', missing_path)])
+        self.assertEqual(self.store.fetch_many([('missing.js', missing_path)], optional=True), [])
+        self.assertFalse(os.path.exists(missing_path))
+
+    def _build_and_clear(self):
+        self.write_js('app.js', 'app', 'var app = 1;')
+        manifest = Manifest()
+        manifest.build()
+        manifest.save()
+        module = manifest.get_manifest(content_type_helper.JAVASCRIPT)['app']
+        shutil.rmtree(os.path.join(self.app_root, 'js', self.env.build_prefix))
+        Manifest._instance = None
+        return module
+
+    def test_primed_files_and_maps_round_trip(self):
+        built = self._build_and_clear()
+        key = paste_store.artifact_key(built)
+        self.assertEqual(sorted(self.server.objects), ['/artifacts/' + key, '/artifacts/' + key + '.map'])
+
+        module = Manifest.get_content_type_manifest(content_type_helper.JAVASCRIPT).manifest['app']
+        self.assertEqual(module.path, built.path)
+        self.assertEqual(self.md5(module.abs_path), built.checksum)
+        self.assertTrue(os.path.exists(module.abs_source_map_path))
+
+    def test_failed_fetch_is_retried(self):
+        built = self._build_and_clear()
+        self.server.failures = 100
+
+        content_type_manifest = Manifest.get_content_type_manifest(content_type_helper.JAVASCRIPT)
+        self.assertEqual(content_type_manifest.url('app'), None)
+        # not retried before the interval
+        self.server.failures = 0
+        self.assertTrue(Manifest.get_content_type_manifest(content_type_helper.JAVASCRIPT) is content_type_manifest)
+
+        Manifest._instance.FETCH_RETRY_INTERVAL = 0
+        Manifest._instance._fetch_retry_at['js'] = 0
+        content_type_manifest = Manifest.get_content_type_manifest(content_type_helper.JAVASCRIPT)
+        self.assertEqual(content_type_manifest.manifest['app'].path, built.path)
+        self.assertTrue(os.path.exists(content_type_manifest.manifest['app'].abs_path))
+        self.assertFalse(Manifest._instance._fetch_due(content_type_helper.JAVASCRIPT))
+
+    def test_resaving_before_fetching_keeps_the_paths(self):
+        built = self._build_and_clear()
+        built_fingerprint = Manifest.load().get_fingerprint(content_type_helper.JAVASCRIPT)
+
+        manifest = Manifest.load()
+        manifest._fingerprints = {}
+        self.assertEqual(manifest.get_fingerprint(content_type_helper.JAVASCRIPT), built_fingerprint)
+        manifest.save()
+        Manifest._instance = None
+
+        module = Manifest.load().get_manifest(content_type_helper.JAVASCRIPT)['app']
+        self.assertEqual((module.path, module.declared_path), (None, built.path))
+        content_type_manifest = Manifest.get_content_type_manifest(content_type_helper.JAVASCRIPT)
+        self.assertEqual(content_type_manifest.manifest['app'].path, built.path)
+        self.assertEqual(self.md5(content_type_manifest.manifest['app'].abs_path), built.checksum)
@@ -0,0 +1,125 @@
+import os
+import threading
+import time
+
+from ...util import content_type_helper
+
+from . import PasteTestCase
+from .. import module as paste_module
+from ..manifest import Manifest
+
+
+class ThreadingTest(PasteTestCase):
+    thread_count = 16
+    calls_per_thread = 100
+
+    def setUp(self):
+        super(ThreadingTest, self).setUp()
+        self.write_js('base.js', 'base', 'var base = 1;')
+        self.write_js('app.js', 'app', 'var app = base;', requires=['base'])
+        self.write('css/site.scss', '@module "site";\nbody { color: red; }\n')
+
+        self.builds = []
+        self._build = Manifest.build
+
+        def counting_build(manifest, content_types=None, **options):
+            self.builds.append(tuple(sorted(content_type.type for content_type in content_types or [])))
+            return self._build(manifest, content_types=content_types, **options)
+
+        Manifest.build = counting_build
+
+    def tearDown(self):
+        Manifest.build = self._build
+        super(ThreadingTest, self).tearDown()
+
+    def _run_threads(self, target, count):
+        errors = []
+        start = threading.Event()
+
+        def run(index):
+            start.wait()
+            try:
+                target(index)
+            except Exception, e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run, args=(index,)) for index in range(count)]
+        for thread in threads:
+            thread.start()
+        start.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_first_requests_build_once_per_content_type(self):
+        content_types = (content_type_helper.JAVASCRIPT, content_type_helper.SCSS)
+        snapshots = dict((content_type.type, set()) for content_type in content_types)
+
+        def request(index):
+            for call in range(self.calls_per_thread):
+                content_type = content_types[(index + call) % len(content_types)]
+                snapshot = Manifest.get_content_type_manifest(content_type)
+                self.assertTrue(snapshot.manifest)
+                snapshots[content_type.type].add(id(snapshot))
+
+        self._run_threads(request, self.thread_count)
+        self.assertEqual(sorted(self.builds), [('js',), ('scss',)])
+        self.assertEqual(dict((key, len(ids)) for key, ids in snapshots.iteritems()), {'js': 1, 'scss': 1})
+
+    def test_readers_never_see_a_snapshot_change(self):
+        Manifest.get_content_type_manifest(content_type_helper.JAVASCRIPT)
+
+        def request(index):
+            if index == 0:
+                # the writer: rebuilds, collects and removes modules while the readers hold snapshots
+                for version in range(10):
+                    self.write_js('app.js', 'app', 'var app = base + %d;' % version, requires=['base'])
+                    Manifest._instance.build(content_types=[content_type_helper.JAVASCRIPT])
+                    Manifest._instance.collect(keep_versions=1)
+                return
+
+            for call in range(self.calls_per_thread):
+                snapshot = Manifest.get_content_type_manifest(content_type_helper.JAVASCRIPT)
+                before = dict((module_name, (module.path, module.version, len(module.serialized_versions)))
+                              for module_name, module in snapshot.manifest.iteritems())
+                for module_name, module in snapshot.manifest.iteritems():
+                    self.assertEqual(before[module_name],
+                                     (module.path, module.version, len(module.serialized_versions)))
+                    self.assertFalse(module.removed)
+
+        self._run_threads(request, self.thread_count)
+
+    def test_snapshots_are_not_mutated_by_later_builds(self):
+        snapshot = Manifest.get_content_type_manifest(content_type_helper.JAVASCRIPT)
+        app, base = snapshot.manifest['app'], snapshot.manifest['base']
+        app_state = (app.path, app.version, list(app.serialized_versions), list(app.dependencies))
+
+        self.write_js('app.js', 'app', 'var app = base + 1;', requires=['base'])
+        os.remove(os.path.join(self.app_root, 'js', 'base.js'))
+        manifest = Manifest._instance
+        manifest.build(content_types=[content_type_helper.JAVASCRIPT])
+        manifest.collect(keep_versions=0)
+
+        self.assertTrue(manifest.get_manifest(content_type_helper.JAVASCRIPT)['base'].removed)
+        self.assertFalse(base.removed)
+        self.assertEqual((app.path, app.version, list(app.serialized_versions), list(app.dependencies)), app_state)
+        self.assertFalse(Manifest.get_content_type_manifest(content_type_helper.JAVASCRIPT) is snapshot)
+
+    def test_readers_never_see_a_content_type_half_loaded(self):
+        manifest = Manifest()
+        manifest.build()
+        manifest.save()
+        Manifest._instance = None
+        manifest = Manifest.load()
+
+        # a slow deserialize widens the window between taking the serialized modules and publishing them
+        _deserialize = paste_module.Module.deserialize
+        paste_module.Module.deserialize = classmethod(
+            lambda cls, obj: time.sleep(0.01) or _deserialize.__func__(cls, obj))
+        try:
+            def request(index):
+                self.assertEqual(sorted(manifest.get_manifest(content_type_helper.JAVASCRIPT)), ['app', 'base'])
+
+            self._run_threads(request, self.thread_count)
+        finally:
+            paste_module.Module.deserialize = _deserialize